@@ -3,9 +3,14 @@ This module creates a GUI for users to input emojis and get book recommendations
 
 import emoji
 import tkinter as tk
-from ..utils.query import process_query
+from concurrent.futures import ThreadPoolExecutor
+from ..utils.audit_log import start_audit_log
+from ..utils.query import get_engine
 import os
 
+# how often (ms) the Tk main loop checks whether a background query has finished
+POLL_INTERVAL_MS = 100
+
 
 def main():
     """Main function to run the Emoji Keyboard GUI."""
@@ -135,6 +140,18 @@ def main():
     current_dir = os.path.dirname(__file__)  # .../emoji_book_rec/emoji_book_rec/utils/
     two_up = os.path.dirname(os.path.dirname(current_dir))  # .../emoji_book_rec/
     filepath = os.path.join(two_up, "data", "emoji_keyword_list.tsv")
+    matrix_path = "emoji_book_rec/data/keyword_book_matrix"
+
+    # every query and its results go to audit.jsonl, written by a background thread
+    start_audit_log()
+
+    # queries run on one background thread so the window never freezes while the matrix loads or
+    # books are scored; results are picked up on the Tk main thread through root.after
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="emoji-query")
+    # start loading the engine right away, so the first query does not have to wait for it
+    executor.submit(get_engine, filepath, matrix_path)
+    # generation goes up with every submit or reset, so a result from a stale query is ignored
+    in_flight = {"future": None, "generation": 0}
 
     # on_click functions
     def keyboard_click(emoji_name):
@@ -152,6 +169,37 @@ def main():
         emoji_input.clear()
         return
 
+    def cancel_query():
+        """Forget the query in flight (if any), so its result is never shown."""
+        in_flight["generation"] += 1
+        if in_flight["future"] is not None:
+            in_flight["future"].cancel()  # only stops it if it has not started yet
+            in_flight["future"] = None
+
+    def show_results(book_recs):
+        """Fill the results page with the returned books."""
+        results_label_header.config(text=f"Top 5 books recommended for: {' '.join(emoji_input)}")
+        for i, label in enumerate(results_labels):
+            title = book_recs[i][0] if i < len(book_recs) else "-"
+            label.config(text=f"Book {i + 1}: {title}")
+
+    def poll_query(future, generation, ticks=0):
+        """Check on a background query from the Tk main loop and show its results when done."""
+        if generation != in_flight["generation"]:
+            return  # a newer submission or a reset replaced this query
+        if not future.done():
+            results_label_header.config(text="Searching" + "." * (ticks % 4))
+            root.after(POLL_INTERVAL_MS, poll_query, future, generation, ticks + 1)
+            return
+
+        in_flight["future"] = None
+        try:
+            book_recs = future.result()
+        except Exception as e:
+            results_label_header.config(text=f"Search failed: {e}")
+            return
+        show_results(book_recs)
+
 # THIS IS THE METHOD OF MAIN WHICH CONNECTS TO THE REST OF THE PIPELINE
     def submit_click():
         """Handle submit button click."""
@@ -179,25 +227,27 @@ def main():
             # remove colons on either side
             emoji_strings.append(short_text[1:-1])
 
-        # process_query returns a full sorted dictionary
-        # key=book title, value=book relevance score
-        book_recs = process_query(emoji_strings, filepath, True, "emoji_book_rec/data/keyword_book_matrix.tsv")
-
-        key_iter = iter(book_recs)
-        book1 = next(key_iter, None)
-        book2 = next(key_iter, None)
-        book3 = next(key_iter, None)
-        book4 = next(key_iter, None)
-        book5 = next(key_iter, None)
+        # the engine returns the top 5 (book title, book relevance score), best first
+        # it is loaded once and reused for every query after that
+        cancel_query()
+        future = executor.submit(lambda: get_engine(filepath, matrix_path).query(emoji_strings, top_k=5))
+        in_flight["future"] = future
 
-        # reveal results frame!
+        # reveal results frame in its "searching" state until the query comes back
         results_frame.pack(fill="both", expand=True)
-        results_label_header.config(text=f"Top 5 books recommended for: {' '.join(emoji_input)}")
-        results_label1.config(text=f"Book 1: {book1[0]}")
-        results_label2.config(text=f"Book 2: {book2[0]}")
-        results_label3.config(text=f"Book 3: {book3[0]}")
-        results_label4.config(text=f"Book 4: {book4[0]}")
-        results_label5.config(text=f"Book 5: {book5[0]}")
+        for label in results_labels:
+            label.config(text="")
+        poll_query(future, in_flight["generation"])
+
+    def new_search_click():
+        """Handle new search button click: drop any running query and go back to the keyboard."""
+        cancel_query()
+        clear_click()
+        results_frame.pack_forget()
+        instruction_label.pack(pady=(10, 0))
+        output.pack(padx=10, pady=10)
+        bottom_buttons.pack(side="bottom", padx=10)
+        keyboard.pack(fill="both", expand=True, pady=10)
 
     # SETTING UP KEYBOARD GUI
     f1 = tk.Frame(root, background=bg_color)
@@ -301,6 +351,17 @@ def main():
         results_frame, text="Book 5", fg="black", font=("Arial", 20), bg="white", wraplength=500, justify="center"
     )
 
+    results_labels = [results_label1, results_label2, results_label3, results_label4, results_label5]
+    new_search_btn = tk.Button(
+        results_frame,
+        text="New search",
+        font=("", font_size, "bold"),
+        width=20,
+        height=2,
+        cursor="hand2",
+        command=lambda: new_search_click(),
+    )
+
     # packing all labels
     results_label_header.pack(pady=30)
     results_label1.pack(pady=10)
@@ -308,10 +369,14 @@ def main():
     results_label3.pack(pady=10)
     results_label4.pack(pady=10)
     results_label5.pack(pady=10)
+    new_search_btn.pack(pady=20)
 
     # MAIN LOOP STARTS HERE
     root.mainloop()
 
+    # the window is closed, drop anything still queued
+    executor.shutdown(wait=False, cancel_futures=True)
+
     return
 
 
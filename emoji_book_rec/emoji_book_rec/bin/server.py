@@ -0,0 +1,353 @@
+"""Local HTTP/JSON recommendation service.
+This module serves book recommendations over HTTP with a query engine that stays loaded, so
+other programs can ask for recommendations without importing the pipeline or paying its load time.
+Requests that arrive close together are micro-batched into one vectorized scoring pass.
+
+POST /recommend  {"emojis": ["skull", "🍷"], "top_k": 5}
+    -> {"emojis": ["skull", "wine_glass"], "results": [{"title": ..., "score": ...}, ...]}
+GET /health      -> {"status": "ok", "books": ..., "keywords": ..., "cache": {"hits": ..., "misses": ...}}
+GET /metrics     -> query pipeline counters and span histograms, in Prometheus text format (with --metrics)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import emoji
+
+from ..utils.audit_log import AUDIT_PATH, audit_enabled, start_audit_log
+from ..utils.instrumentation import METRICS
+from ..utils.query import AUDIT_RESULTS, audit_query, get_engine
+from ..utils.query_cache import query_key
+
+MAX_BODY_BYTES = 64 * 1024
+logger = logging.getLogger(__name__)
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+def normalize_emojis(items):
+    """Turn Unicode emoji or short texts (with or without colons) into the short texts the engine uses.
+    :param items: List of strings from the request
+    :return: List of emoji short texts
+    """
+    short_texts = []
+    for item in items:
+        if not isinstance(item, str):
+            raise ValueError("emojis must be a list of strings")
+        item = item.strip()
+        if emoji.is_emoji(item):
+            item = emoji.demojize(item)
+        # remove colons on either side
+        if len(item) > 1 and item.startswith(":") and item.endswith(":"):
+            item = item[1:-1]
+        short_texts.append(item)
+    return short_texts
+
+
+class MicroBatcher:
+    """Collects queries that arrive close together and scores them with one query_batch call."""
+
+    def __init__(self, engine, max_batch=64, max_delay=0.002):
+        """
+        :param engine: QueryEngine to score with
+        :param max_batch: Largest number of queries scored together
+        :param max_delay: Seconds to wait for more queries after the first one of a batch arrives
+        """
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.queries = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def recommend(self, query, top_k):
+        """Queue one query and wait for its results.
+        :param query: List of emoji short texts
+        :param top_k: Number of books to return
+        :return: Ranked list of (book title, score)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, top_k, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # one scoring pass for the whole batch, off the event loop so connections keep being served
+            top_k = max(k for _, k, _ in batch)
+            try:
+                results = await loop.run_in_executor(
+                    None, self.engine.query_batch, [q for q, _, _ in batch], top_k
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.queries += len(batch)
+            for (_, k, future), ranked in zip(batch, results):
+                if not future.done():
+                    future.set_result(ranked[:k])
+
+
+class RecommendationServer:
+    """Minimal asyncio HTTP/1.1 server (keep-alive, JSON bodies) in front of a MicroBatcher."""
+
+    def __init__(self, engine, max_batch=64, max_delay=0.002, default_top_k=5, max_top_k=100):
+        """
+        :param engine: QueryEngine to score with
+        :param max_batch: Largest number of queries scored together
+        :param max_delay: Seconds to wait for more queries before scoring a batch
+        :param default_top_k: Number of books returned when a request does not ask for top_k
+        :param max_top_k: Largest top_k a request may ask for
+        """
+        self.engine = engine
+        self.batcher = MicroBatcher(engine, max_batch=max_batch, max_delay=max_delay)
+        self.default_top_k = default_top_k
+        self.max_top_k = max_top_k
+        self.server = None
+        self._reload_lock = asyncio.Lock()
+
+    async def current_engine(self):
+        """The engine to answer with, reloaded (through get_engine) once its files changed on disk.
+        The reload runs off the event loop, one at a time; if it fails the loaded engine is kept."""
+        if not self.engine.is_current():
+            async with self._reload_lock:
+                # another request may have reloaded it while this one waited
+                if not self.engine.is_current():
+                    engine = await asyncio.get_running_loop().run_in_executor(
+                        None, get_engine, self.engine.filepath, self.engine.matrix_path, type(self.engine)
+                    )
+                    self.engine = self.batcher.engine = engine
+        return self.engine
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """Start listening.
+        :return: The (host, port) actually bound, useful with port=0
+        """
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    # longer than the stream's buffer limit
+                    await self._respond(writer, 400, {"error": "request line too long"}, keep_alive=False)
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+
+                try:
+                    headers = await self._read_headers(reader)
+                except ValueError:
+                    await self._respond(writer, 431, {"error": "request header too large"}, keep_alive=False)
+                    break
+
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad Content-Length"}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, payload = await self._route(method, target.split("?", 1)[0], body)
+                except Exception:
+                    # e.g. the engine failing on a batch; the client still gets an answer
+                    logger.exception("error handling %s %s", method, target)
+                    status, payload = 500, {"error": "internal server error"}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        except Exception:
+            logger.exception("error on connection")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader):
+        """Read header lines up to the blank line that ends them.
+        :return: Dict of lowercased header names to values
+        :raises ValueError: If a line is longer than the stream's buffer limit
+        """
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _route(self, method, path, body):
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            engine = await self.current_engine()
+            return 200, {
+                "status": "ok",
+                "books": len(engine.matrix.books),
+                "keywords": len(engine.matrix.keywords),
+                "batches": self.batcher.batches,
+                "queries": self.batcher.queries,
+                "cache": engine.cache.stats(),
+            }
+
+        if path == "/metrics":
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            # plain text for a Prometheus scraper; empty unless instrumentation is on
+            return 200, METRICS.to_prometheus()
+
+        if path == "/recommend":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                request = json.loads(body or b"{}")
+                emojis = normalize_emojis(request.get("emojis") or [])
+                top_k = int(request.get("top_k", self.default_top_k))
+            except (ValueError, TypeError, AttributeError) as e:
+                return 400, {"error": f"bad request: {e}"}
+            if not emojis:
+                return 400, {"error": "emojis must be a non-empty list"}
+            if not 1 <= top_k <= self.max_top_k:
+                return 400, {"error": f"top_k must be between 1 and {self.max_top_k}"}
+
+            # repeated queries are answered from the engine's result cache without being batched
+            start = time.perf_counter()
+            cache = (await self.current_engine()).cache
+            key = query_key(emojis, top_k, False)
+            found, ranked = cache.get(key)
+            if not found:
+                # with the audit log on, the AUDIT_RESULTS books it records are ranked in the same batch
+                depth = max(top_k, AUDIT_RESULTS) if audit_enabled() else top_k
+                ranked = await self.batcher.recommend(emojis, depth)
+                cache.put(key, tuple(ranked))
+            audit_query(emojis, top_k, ranked, start, cached=found)
+            return 200, {"emojis": emojis, "results": [{"title": t, "score": s} for t, s in ranked[:top_k]]}
+
+        return 404, {"error": f"no route for {path}"}
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(engine, host, port, max_batch, max_delay):
+    """Run the service until cancelled."""
+    server = RecommendationServer(engine, max_batch=max_batch, max_delay=max_delay)
+    bound_host, bound_port = await server.start(host, port)
+    print(f"Serving book recommendations on http://{bound_host}:{bound_port}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    """Load the engine once and serve it over HTTP."""
+    current_dir = os.path.dirname(__file__)
+    two_up = os.path.dirname(os.path.dirname(current_dir))  # .../emoji_book_rec/
+
+    parser = argparse.ArgumentParser(description="Serve emoji book recommendations over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument(
+        "--keywords", default=os.path.join(two_up, "data", "emoji_keyword_list.tsv"), help="Emoji keyword list TSV"
+    )
+    parser.add_argument("--matrix", default="emoji_book_rec/data/keyword_book_matrix", help="Matrix artifact directory")
+    parser.add_argument("--max-batch", type=int, default=64, help="Most queries scored in one pass (default: 64)")
+    parser.add_argument(
+        "--max-delay-ms", type=float, default=2.0, help="How long to wait to fill a batch, in ms (default: 2)"
+    )
+    parser.add_argument(
+        "--metrics", action="store_true", help="Record per-stage timings and counters, served at /metrics"
+    )
+    parser.add_argument(
+        "--audit-log",
+        default=AUDIT_PATH,
+        help=f"JSON-lines file every query and its results are logged to, '' to turn it off (default: {AUDIT_PATH})",
+    )
+    args = parser.parse_args()
+    if args.metrics:
+        METRICS.enable()
+    if args.audit_log:
+        start_audit_log(args.audit_log)
+
+    # loaded before listening, so the first request is as fast as the rest
+    engine = get_engine(args.keywords, args.matrix)
+    try:
+        asyncio.run(serve(engine, args.host, args.port, args.max_batch, args.max_delay_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+
+    main()
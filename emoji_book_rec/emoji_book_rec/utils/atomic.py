@@ -0,0 +1,68 @@
+"""Replace artifact files without writing into ones a reader may have open.
+Query engines memory-map the artifacts, and truncating or rewriting a mapped file makes the
+process crash (SIGBUS) the next time it touches the mapping. Every artifact file is instead written
+under a temporary name next to its destination and renamed over it: the rename is atomic, readers
+of the old file keep its contents until they let go of it, and new readers see a complete file.
+Files that only make sense together (a whole matrix artifact, an emoji index) are built in a
+sibling directory that is swapped in for the old one once everything is written."""
+
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+
+@contextmanager
+def replacing(path):
+    """Yield a temporary path to write instead of path, moved over path when the block finishes.
+    If the block raises, the temporary file is removed and path is left as it was.
+    :param path: File to replace
+    """
+    tmp_path = f"{path}.{os.getpid()}.new"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_array(path, array):
+    """np.save an array to path, replacing any previous file atomically."""
+    # through a file object, np.save would otherwise append .npy to the temporary name
+    with replacing(path) as tmp_path, open(tmp_path, "wb") as f:
+        np.save(f, array)
+
+
+def save_json(path, obj, **kwargs):
+    """json.dump an object to path, replacing any previous file atomically.
+    :param kwargs: Passed on to json.dump
+    """
+    with replacing(path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, **kwargs)
+
+
+@contextmanager
+def replacing_dir(path):
+    """Yield a new, empty directory to build instead of path, swapped in for it when the block finishes.
+    Until then path keeps the previous contents, so nobody loads a half-written set of files. The
+    swap is two renames: for that instant path does not exist, and a reader that fails to load it
+    should keep what it had and try again later. If the block raises, path is left as it was.
+    :param path: Directory to replace (it does not have to exist yet)
+    """
+    path = os.path.normpath(path)
+    tmp_path = f"{path}.{os.getpid()}.new"
+    old_path = f"{path}.{os.getpid()}.old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        yield tmp_path
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        # files readers still have open or memory-mapped stay readable after this
+        shutil.rmtree(old_path, ignore_errors=True)
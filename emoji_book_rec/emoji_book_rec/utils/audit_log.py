@@ -0,0 +1,152 @@
+"""Asynchronous JSON-lines audit log of queries and their rankings.
+A query only puts one record on a bounded in-memory queue; a background thread formats the
+records as JSON lines and writes them to a size-rotated file. When the writer falls behind and
+the queue is full, new records are dropped (and counted) instead of making queries wait, so
+query latency never depends on disk speed. Nothing is written until start_audit_log() is called."""
+
+import atexit
+from datetime import datetime
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+import threading
+
+from .instrumentation import METRICS
+
+# its own file, kept apart from the plain text of logs.txt so every line parses as JSON
+AUDIT_PATH = "audit.jsonl"
+AUDIT_LOGGER = logging.getLogger("emoji_book_rec.audit")
+# audit records only go to the audit file, never to whatever the root logger writes to
+AUDIT_LOGGER.propagate = False
+AUDIT_LOGGER.setLevel(logging.INFO)
+
+# running audit logs; other handlers (e.g. a test harness's) may sit on the logger too
+_running = []
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a record as one JSON object: time, level, event and the record's audit fields."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "audit", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of waiting when its queue is full."""
+
+    def __init__(self, record_queue, block_timeout=0.0):
+        """
+        :param record_queue: queue.Queue with a maxsize
+        :param block_timeout: Seconds to wait for room in a full queue before dropping, 0 to never wait
+        """
+        super().__init__(record_queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.block_timeout > 0:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            METRICS.inc("audit_dropped")
+
+
+class AuditLog:
+    """Background writer of the audit logger's records to a rotating JSON-lines file."""
+
+    def __init__(self, path=AUDIT_PATH, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000,
+                 block_timeout=0.0):
+        """
+        :param path: File to write the JSON lines to
+        :param max_bytes: Size at which the file is rotated (path.1, path.2, ...), 0 to never rotate
+        :param backup_count: Number of rotated files kept
+        :param queue_size: Most records waiting to be written; more are dropped
+        :param block_timeout: Seconds a query may wait for room in a full queue before its record is dropped
+        """
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.file_handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self.file_handler.setFormatter(JsonLinesFormatter())
+        self.handler = BoundedQueueHandler(self.queue, block_timeout=block_timeout)
+        self.listener = QueueListener(self.queue, self.file_handler)
+        self.running = False
+
+    @property
+    def dropped(self):
+        """Number of records dropped because the queue was full."""
+        return self.handler.dropped
+
+    def start(self):
+        self.listener.start()
+        AUDIT_LOGGER.addHandler(self.handler)
+        _running.append(self)
+        self.running = True
+        return self
+
+    def stop(self):
+        """Stop taking records, write out everything still queued and close the file."""
+        if not self.running:
+            return
+        AUDIT_LOGGER.removeHandler(self.handler)
+        _running.remove(self)
+        self.running = False
+        if self.dropped:
+            # waits for room, so the drop count itself is never lost
+            record = AUDIT_LOGGER.makeRecord(
+                AUDIT_LOGGER.name, logging.WARNING, __file__, 0, "audit_dropped", None, None,
+                extra={"audit": {"dropped": self.dropped}},
+            )
+            self.queue.put(record)
+        self.listener.stop()
+        self.file_handler.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def audit_enabled():
+    """Whether an audit log is running, so callers can skip building records nobody writes."""
+    return bool(_running)
+
+
+def audit(event, **fields):
+    """Emit one audit record (a no-op unless an audit log is running).
+    :param event: Event name, e.g. "query"
+    :param fields: JSON-serializable fields of the record
+    """
+    if audit_enabled():
+        AUDIT_LOGGER.info(event, extra={"audit": fields})
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def start_audit_log(path=AUDIT_PATH, **options):
+    """Start the shared audit log (once) and stop it when the program exits.
+    :param path: File to write the JSON lines to
+    :param options: Other AuditLog arguments
+    :return: The running AuditLog
+    """
+    global _default
+    with _default_lock:
+        if _default is None or not _default.running:
+            _default = AuditLog(path, **options).start()
+            atexit.register(_default.stop)
+        return _default
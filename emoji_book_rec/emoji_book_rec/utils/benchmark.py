@@ -0,0 +1,328 @@
+"""Benchmark the index build and query latency on synthetic book catalogues.
+Catalogues of any size are generated from the real emoji keyword vocabulary, so runs are
+reproducible (same seed, same books) and do not need the downloaded dataset. Every run builds
+the matrix with IndexBuilder, then times process_query calls on a freshly loaded engine and on
+a loaded one, and batch throughput, and the results come out as JSON for comparing runs and sizing hardware."""
+
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import query as query_module
+from .index_builder import KEYWORD_PATH, IndexBuilder
+from .instrumentation import METRICS
+from .keyword_tsv_to_dict import generate_keyword_dict
+from .synonyms import SYNONYMS_PATH
+
+# plain words for the rest of each description
+FILLER_WORDS = (
+    "the a an and of to in on with for as at by from his her their this that story novel life "
+    "world years family young old man woman city town journey between must finds after before "
+    "new first last time way home war love secret past future friends across into through"
+).split()
+# books generated per block; fixed, since the random stream (and so the catalogue) depends on it
+CATALOGUE_BLOCK = 100000
+
+
+def synthetic_catalogue(path, n_books, keyword_path=KEYWORD_PATH, seed=0, description_words=60,
+                        keyword_rate=0.05):
+    """Write a books CSV of made-up descriptions mixing emoji keywords into filler words.
+    :param path: CSV file to write (Title, Authors and Description columns)
+    :param n_books: Number of books
+    :param keyword_path: Emoji keyword list TSV the keywords are drawn from
+    :param seed: Random seed, the same seed always gives the same catalogue
+    :param description_words: Number of words in each description
+    :param keyword_rate: Share of description words that are keywords
+    :return: path
+    """
+    keywords = sorted({kw.lower() for kws in generate_keyword_dict(keyword_path).values() for kw in kws})
+    vocabulary = np.array(keywords + FILLER_WORDS, dtype=object)
+    rng = np.random.default_rng(seed)
+
+    # written a block at a time so a catalogue of millions of books never sits in memory
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for start in range(0, n_books, CATALOGUE_BLOCK):
+            n = min(CATALOGUE_BLOCK, n_books - start)
+            # a keyword with probability keyword_rate, otherwise a filler word
+            is_keyword = rng.random((n, description_words)) < keyword_rate
+            words = np.where(
+                is_keyword,
+                rng.integers(0, len(keywords), (n, description_words)),
+                rng.integers(len(keywords), len(vocabulary), (n, description_words)),
+            )
+            ids = np.arange(start, start + n)
+            pd.DataFrame(
+                {
+                    "Title": [f"Book {i}" for i in ids],
+                    "Authors": [f"Author {i % 1000}" for i in ids],
+                    "Description": [" ".join(row) for row in vocabulary[words]],
+                }
+            ).to_csv(f, index=False, header=start == 0)
+    return path
+
+
+def random_queries(emojis, n_queries, seed=0, max_emojis=5):
+    """Draw random emoji queries of 1 to max_emojis distinct emojis.
+    :param emojis: List of emoji short texts
+    :param n_queries: Number of queries
+    :param seed: Random seed
+    :param max_emojis: Largest number of emojis in a query
+    :return: List of queries, each a list of emoji short texts
+    """
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, max_emojis + 1, n_queries)
+    return [[emojis[i] for i in rng.choice(len(emojis), size, replace=False)] for size in sizes]
+
+
+def latency_summary(seconds):
+    """Summarize a list of timings (in seconds) as count, mean and percentiles in milliseconds."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"n": 0}
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def directory_size(path):
+    """Total size in bytes of every file under a directory."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def peak_memory():
+    """Peak resident memory of this process and of its finished workers, in bytes (None if unknown)."""
+    try:
+        import resource
+    except ImportError:
+        return {"self": None, "children": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+def benchmark_build(books_path, work_dir, keyword_path=KEYWORD_PATH, synonym_path=SYNONYMS_PATH, workers=1,
+                    chunk_size=50000, word_boundary=False, tokenize=False):
+    """Time a full build and an incremental build with nothing to do.
+    :return: Dict of timings and artifact sizes
+    """
+    builder = IndexBuilder(
+        books_path,
+        keyword_path=keyword_path,
+        out_dir=os.path.join(work_dir, "matrix"),
+        postings_dir=os.path.join(work_dir, "postings"),
+        synonym_path=synonym_path,
+        word_boundary=word_boundary,
+        tokenize=tokenize,
+        workers=workers,
+        chunk_size=chunk_size,
+        incremental=True,
+    )
+    start = time.perf_counter()
+    summary = builder.build()
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    builder.build()
+    up_to_date = time.perf_counter() - start
+
+    return {
+        "full_s": full,
+        "up_to_date_s": up_to_date,
+        "books_per_s": summary["n_books"] / full if full else None,
+        "n_books": summary["n_books"],
+        "n_keywords": summary["n_keywords"],
+        "nnz": summary["nnz"],
+        "matrix_bytes": directory_size(builder.out_dir),
+        "postings_bytes": directory_size(builder.postings_dir),
+    }
+
+
+def benchmark_queries(work_dir, keyword_path=KEYWORD_PATH, n_queries=200, batch_size=1024, top_k=5, fresh_runs=3,
+                      seed=0):
+    """Time process_query (fresh and loaded engine, matrix and posting paths) and batch throughput.
+    The fresh engine times include loading the engine, but the artifact was just written, so its files
+    are usually still in the OS page cache (which is not dropped): they are not cold-disk times.
+    :return: Dict of latency summaries and throughput
+    """
+    matrix_path = os.path.join(work_dir, "matrix")
+    postings_path = os.path.join(work_dir, "postings")
+    queries = random_queries(list(generate_keyword_dict(keyword_path)), n_queries, seed=seed)
+
+    def timed(run_query, timed_queries, fresh=False):
+        timings = []
+        for q in timed_queries:
+            if fresh:
+                # dropping the shared engines makes the next call load the artifact again
+                query_module.clear_engines()
+            start = time.perf_counter()
+            run_query(q)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def matrix_query(q):
+        return query_module.process_query(q, keyword_path, matrix_path=matrix_path, top_k=top_k)
+
+    def posting_query(q):
+        return query_module.process_query(
+            q, keyword_path, use_precomputed=False, postings_path=postings_path, top_k=top_k
+        )
+
+    results = {
+        "fresh_engine": latency_summary(timed(matrix_query, queries[:fresh_runs], fresh=True)),
+        # distinct random queries mostly miss the result cache, repeating them all hits it
+        "warm": latency_summary(timed(matrix_query, queries)),
+        "cached": latency_summary(timed(matrix_query, queries)),
+        "postings_fresh_engine": latency_summary(timed(posting_query, queries[:fresh_runs], fresh=True)),
+        "postings_warm": latency_summary(timed(posting_query, queries)),
+    }
+
+    engine = query_module.get_engine(keyword_path, matrix_path)
+    start = time.perf_counter()
+    for _ in engine.query_stream(queries, top_k=top_k, batch_size=batch_size):
+        pass
+    elapsed = time.perf_counter() - start
+    results["batch"] = {
+        "n": len(queries),
+        "batch_size": batch_size,
+        "total_s": elapsed,
+        "queries_per_s": len(queries) / elapsed if elapsed else None,
+    }
+    query_module.clear_engines()
+    return results
+
+
+def run_benchmark(sizes, work_dir=None, keyword_path=KEYWORD_PATH, synonym_path=SYNONYMS_PATH, workers=1,
+                  chunk_size=50000, n_queries=200, batch_size=1024, top_k=5, seed=0, spans=False, tokenize=False):
+    """Generate a catalogue of each size, build it and time queries against it.
+    :param sizes: List of catalogue sizes (number of books)
+    :param work_dir: Directory for the catalogues and artifacts, a temporary one if None
+    :param keyword_path: Emoji keyword list TSV
+    :param synonym_path: WordNet synonym cache, shared by every run
+    :param workers: Number of build worker processes
+    :param chunk_size: Number of books read and scored at a time
+    :param n_queries: Number of random queries timed per run
+    :param batch_size: Number of queries per batch in the throughput test
+    :param top_k: Number of books returned per query
+    :param seed: Random seed for catalogues and queries
+    :param tokenize: If True, build with token matching instead of substring counting
+    :param spans: If True, also record the query pipeline's per-stage spans and counters for each size
+    :return: Dict with the environment ("meta") and one result per size ("runs")
+    """
+    meta = {
+        "started": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "tokenize": tokenize,
+        "n_queries": n_queries,
+        "batch_size": batch_size,
+        "top_k": top_k,
+        "seed": seed,
+    }
+    runs = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        for n_books in sizes:
+            run_dir = os.path.join(tmp, str(n_books))
+            os.makedirs(run_dir)
+            start = time.perf_counter()
+            books_path = synthetic_catalogue(
+                os.path.join(run_dir, "books.csv"), n_books, keyword_path=keyword_path, seed=seed
+            )
+            generate = time.perf_counter() - start
+
+            build = benchmark_build(
+                books_path, run_dir, keyword_path=keyword_path, synonym_path=synonym_path, workers=workers,
+                chunk_size=chunk_size, tokenize=tokenize,
+            )
+            build["generate_s"] = generate
+
+            # spans cost a little time themselves, so they are only on when asked for
+            was_enabled = METRICS.enabled
+            if spans:
+                METRICS.enable()
+                METRICS.reset()
+            try:
+                queries = benchmark_queries(
+                    run_dir, keyword_path=keyword_path, n_queries=n_queries, batch_size=batch_size, top_k=top_k,
+                    seed=seed,
+                )
+            finally:
+                METRICS.enable(was_enabled)
+            run = {"n_books": n_books, "build": build, "query": queries, "peak_memory": peak_memory()}
+            if spans:
+                run["spans"] = METRICS.snapshot()
+            runs.append(run)
+    return {"meta": meta, "runs": runs}
+
+
+def main(argv=None):
+    """Run the benchmark from the command line and write the results as JSON.
+    :param argv: Command line arguments, defaults to sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark index build and query latency")
+    parser.add_argument(
+        "-n", "--sizes", type=int, nargs="+", default=[10000], help="Catalogue sizes to benchmark (default: 10000)"
+    )
+    parser.add_argument("-o", "--output", default=None, help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("-d", "--work-dir", default=None, help="Directory for the generated catalogues and artifacts")
+    parser.add_argument("-k", "--keywords", default=KEYWORD_PATH, help=f"Emoji keyword list TSV (default: {KEYWORD_PATH})")
+    parser.add_argument(
+        "-s", "--synonyms", default=SYNONYMS_PATH, help=f"Path to the WordNet synonym cache (default: {SYNONYMS_PATH})"
+    )
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of build worker processes (default: 1)")
+    parser.add_argument(
+        "-c", "--chunk-size", type=int, default=50000, help="Number of books scored at a time (default: 50000)"
+    )
+    parser.add_argument("-q", "--queries", type=int, default=200, help="Number of timed queries per size (default: 200)")
+    parser.add_argument("-b", "--batch-size", type=int, default=1024, help="Queries per batch (default: 1024)")
+    parser.add_argument("--top-k", type=int, default=5, help="Books returned per query (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("-t", "--tokenize", action="store_true", help="Build with token matching")
+    parser.add_argument("--spans", action="store_true", help="Also record per-stage query spans and counters")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        args.sizes,
+        work_dir=args.work_dir,
+        keyword_path=args.keywords,
+        synonym_path=args.synonyms,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        n_queries=args.queries,
+        batch_size=args.batch_size,
+        top_k=args.top_k,
+        seed=args.seed,
+        spans=args.spans,
+        tokenize=args.tokenize,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+
+    main()
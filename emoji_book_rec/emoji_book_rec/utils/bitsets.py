@@ -0,0 +1,62 @@
+"""Packed keyword bitsets.
+Which keywords were found in a book is stored as one bit per keyword row, packed into uint64 words,
+so the number of distinct query keywords in every book is an AND and a popcount over a few words."""
+
+import numpy as np
+from scipy import sparse
+
+# popcount of every byte value, for numpy versions without np.bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def n_words(n_keywords):
+    """Number of uint64 words needed for one bit per keyword."""
+    return max(1, (n_keywords + 63) // 64)
+
+
+def popcount(words):
+    """Count the set bits in each row of packed uint64 words.
+    :param words: 2D uint64 array, one row of words per item
+    :return: 1D int array of bit counts, one per row
+    """
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    counts = _BYTE_POPCOUNT[words.view(np.uint8)]
+    return counts.reshape(len(words), 8 * words.shape[1]).sum(axis=1, dtype=np.int64)
+
+
+def keyword_mask(rows, n_keywords):
+    """Pack keyword row numbers into a bitset.
+    :param rows: Iterable of keyword row numbers
+    :param n_keywords: Number of keywords in the matrix
+    :return: 1D uint64 array of words
+    """
+    mask = np.zeros(n_words(n_keywords), dtype=np.uint64)
+    for row in rows:
+        mask[row >> 6] |= np.uint64(1) << np.uint64(row & 63)
+    return mask
+
+
+def mask_rows(mask):
+    """Unpack a bitset into the keyword row numbers it holds.
+    :param mask: 1D uint64 array of words
+    :return: Sorted array of keyword row numbers
+    """
+    bits = np.unpackbits(np.ascontiguousarray(mask, dtype="<u8").view(np.uint8), bitorder="little")
+    return np.flatnonzero(bits)
+
+
+def book_keyword_bits(matrix):
+    """Pack which keywords have a nonzero score in each book into one bitset per book.
+    :param matrix: 2D array or scipy sparse matrix with one row per keyword and one column per book
+    :return: 2D uint64 array with one row of words per book
+    """
+    csr = sparse.csr_matrix(matrix)
+    n_keywords, n_books = csr.shape
+    bits = np.zeros((n_books, n_words(n_keywords)), dtype=np.uint64)
+    rows = np.repeat(np.arange(n_keywords, dtype=np.int64), np.diff(csr.indptr))
+    present = csr.data > 0
+    rows, cols = rows[present], csr.indices[present]
+    np.bitwise_or.at(bits, (cols, rows >> 6), np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64)))
+    return bits
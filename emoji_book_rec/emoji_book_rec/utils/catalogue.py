@@ -0,0 +1,86 @@
+"""Book catalogue: dense integer book ids and their labels in a string pool.
+The matrix, the posting lists and the scoring code only deal in book ids (column numbers). The
+"Title Authors" labels are stored once as a single UTF-8 buffer plus offsets, memory-mapped on
+load, and a label is only decoded when a ranked book is shown. Books with the same title and
+authors keep their own ids instead of colliding on the label."""
+
+import os
+
+import numpy as np
+
+from .atomic import save_array
+
+LABELS_FILE = "book_labels.npy"
+OFFSETS_FILE = "book_offsets.npy"
+
+
+class BookCatalogue:
+    """Sequence of book labels indexed by book id, backed by a string pool."""
+
+    def __init__(self, pool, offsets):
+        """
+        :param pool: uint8 array with every label's UTF-8 bytes, one after the other
+        :param offsets: int64 array with the start of each label in pool (one more entry than books)
+        """
+        self.pool = pool
+        self.offsets = offsets
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Build a catalogue from a list of labels; book ids are their positions.
+        :param labels: Iterable of book labels
+        :return: BookCatalogue
+        """
+        if isinstance(labels, BookCatalogue):
+            return labels
+        encoded = [str(label).encode("utf-8") for label in labels]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, book_id):
+        """Decode the label of one book.
+        :param book_id: Book id (column index)
+        :return: Label string
+        """
+        book_id = int(book_id)
+        if not -len(self) <= book_id < len(self):
+            raise IndexError(f"book id {book_id} out of range")
+        book_id %= len(self)
+        start, end = self.offsets[book_id], self.offsets[book_id + 1]
+        return bytes(self.pool[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for book_id in range(len(self)):
+            yield self[book_id]
+
+
+def save_catalogue(out_dir, books):
+    """Write a book catalogue into an artifact directory.
+    The catalogue may be memory-mapped from the very files being replaced; they are only renamed
+    over once the new ones are written, so it is never read back from a half-written file.
+    :param out_dir: Directory to write into
+    :param books: BookCatalogue or list of book labels, in book id order
+    """
+    catalogue = BookCatalogue.from_labels(books)
+    save_array(os.path.join(out_dir, LABELS_FILE), np.asarray(catalogue.pool, dtype=np.uint8))
+    save_array(os.path.join(out_dir, OFFSETS_FILE), np.asarray(catalogue.offsets, dtype=np.int64))
+
+
+def load_catalogue(in_dir):
+    """Load (memory-mapped) the book catalogue of an artifact directory.
+    :param in_dir: Directory written by save_catalogue
+    :return: BookCatalogue
+    """
+    offsets = np.load(os.path.join(in_dir, OFFSETS_FILE))
+    # an empty buffer cannot be memory-mapped
+    pool = np.load(os.path.join(in_dir, LABELS_FILE), mmap_mode="r" if offsets[-1] else None)
+    return BookCatalogue(pool, offsets)
+
+
+def catalogue_exists(in_dir):
+    """Whether an artifact directory has a book catalogue (older artifacts have books.json instead)."""
+    return os.path.exists(os.path.join(in_dir, OFFSETS_FILE))
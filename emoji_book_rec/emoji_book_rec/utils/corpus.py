@@ -0,0 +1,170 @@
+"""Normalized description corpus shared by every index build.
+Reading the books CSV and lowercasing every description is done once: the cleaned, lowercased
+descriptions are written as a single UTF-8 buffer plus offsets (the same string pool layout as
+the book catalogue), next to the book labels and the per-book fingerprints. Later builds,
+incremental updates and experiments memory-map the corpus and read descriptions straight from it,
+and it is only rebuilt when the source CSV changes."""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .catalogue import BookCatalogue, load_catalogue, save_catalogue
+from .matrix_builder import fingerprint_books
+
+CORPUS_DIR = "emoji_book_rec/data/description_corpus"
+TEXT_FILE = "descriptions.npy"
+TEXT_OFFSETS_FILE = "description_offsets.npy"
+FINGERPRINTS_FILE = "fingerprints.npy"
+CORPUS_FILE = "corpus.json"
+# bumped whenever normalize() changes, so older corpora are rebuilt
+CORPUS_VERSION = 1
+
+
+def read_books(filepath, chunk_size=50000):
+    """Read the books dataset a chunk of rows at a time, skipping books without a description.
+    :param filepath: Path to the books CSV
+    :param chunk_size: Number of CSV rows per chunk
+    :return: Generator of DataFrames
+    """
+    for books_df in pd.read_csv(filepath, chunksize=chunk_size):
+        yield books_df[books_df["Description"].notna() & (books_df["Description"].str.strip() != "")]
+
+
+def book_labels(books_df):
+    """The "Title Authors" label of every book in a DataFrame."""
+    return (books_df["Title"] + " " + books_df["Authors"]).tolist()
+
+
+def normalize(descriptions):
+    """Case fold descriptions the way the matcher expects them.
+    :param descriptions: pandas Series of raw descriptions
+    :return: List of normalized descriptions
+    """
+    return descriptions.str.lower().tolist()
+
+
+class DescriptionCorpus:
+    """Book labels, normalized descriptions and fingerprints, indexed by book id."""
+
+    def __init__(self, books, descriptions, fingerprints):
+        """
+        :param books: BookCatalogue of book labels
+        :param descriptions: BookCatalogue-style string pool of the normalized descriptions
+        :param fingerprints: uint64 array with one fingerprint (of label and raw description) per book
+        """
+        self.books = books
+        self.descriptions = descriptions
+        self.fingerprints = fingerprints
+
+    def __len__(self):
+        return len(self.books)
+
+    def chunk(self, start, end):
+        """Decode the normalized descriptions of a range of books.
+        :param start: First book id
+        :param end: Book id after the last one
+        :return: List of descriptions
+        """
+        offsets = self.descriptions.offsets[start:end + 1]
+        if len(offsets) < 2:
+            return []
+        # one slice of the buffer for the whole range, then split on the offsets
+        buffer = bytes(self.descriptions.pool[offsets[0]:offsets[-1]])
+        bounds = (offsets - offsets[0]).tolist()
+        return [buffer[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def chunks(self, chunk_size):
+        """Yield (start, end) book id ranges of at most chunk_size books."""
+        for start in range(0, len(self), chunk_size):
+            yield start, min(start + chunk_size, len(self))
+
+
+def source_stamp(books_path):
+    """Identify the state of the source CSV on disk."""
+    stat = os.stat(books_path)
+    return {"source": os.path.abspath(books_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_corpus(books_path, corpus_dir=CORPUS_DIR, chunk_size=50000):
+    """Read and normalize the books CSV once, streaming it into a corpus directory.
+    :param books_path: Path to the books CSV (Title, Authors and Description columns)
+    :param corpus_dir: Directory to write the corpus into
+    :param chunk_size: Number of CSV rows read at a time
+    :return: DescriptionCorpus, memory-mapped from corpus_dir
+    """
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    os.makedirs(corpus_dir)
+    raw_path = os.path.join(corpus_dir, "descriptions.bin")
+    labels, text_offsets, fingerprints = [], [np.zeros(1, dtype=np.int64)], []
+    n_bytes = 0
+    with open(raw_path, "wb") as raw:
+        for books_df in read_books(books_path, chunk_size):
+            books = book_labels(books_df)
+            encoded = [desc.encode("utf-8") for desc in normalize(books_df["Description"])]
+            raw.write(b"".join(encoded))
+            text_offsets.append(n_bytes + np.cumsum([len(e) for e in encoded], dtype=np.int64))
+            n_bytes += sum(len(e) for e in encoded)
+            labels.extend(books)
+            fingerprints.append(fingerprint_books(books, books_df["Description"].tolist()))
+
+    # the raw buffer becomes an .npy file so it can be memory-mapped like the other arrays
+    text_path = os.path.join(corpus_dir, TEXT_FILE)
+    if n_bytes:
+        text = np.lib.format.open_memmap(text_path, mode="w+", dtype=np.uint8, shape=(n_bytes,))
+        text[:] = np.memmap(raw_path, dtype=np.uint8, mode="r", shape=(n_bytes,))
+        del text  # flushes the memory map
+    else:
+        # an empty array cannot be memory-mapped
+        np.save(text_path, np.zeros(0, dtype=np.uint8))
+    os.remove(raw_path)
+
+    np.save(os.path.join(corpus_dir, TEXT_OFFSETS_FILE), np.concatenate(text_offsets))
+    np.save(
+        os.path.join(corpus_dir, FINGERPRINTS_FILE),
+        np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint64),
+    )
+    save_catalogue(corpus_dir, labels)
+    # written last, so an interrupted build never looks complete
+    with open(os.path.join(corpus_dir, CORPUS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": CORPUS_VERSION, "n_books": len(labels), **source_stamp(books_path)}, f, indent=1)
+    return load_corpus(corpus_dir)
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """Load (memory-mapped) a corpus written by build_corpus.
+    :param corpus_dir: Corpus directory
+    :return: DescriptionCorpus
+    """
+    offsets = np.load(os.path.join(corpus_dir, TEXT_OFFSETS_FILE))
+    # an empty buffer cannot be memory-mapped
+    text = np.load(os.path.join(corpus_dir, TEXT_FILE), mmap_mode="r" if offsets[-1] else None)
+    fingerprints = np.load(os.path.join(corpus_dir, FINGERPRINTS_FILE))
+    return DescriptionCorpus(load_catalogue(corpus_dir), BookCatalogue(text, offsets), fingerprints)
+
+
+def corpus_is_current(books_path, corpus_dir=CORPUS_DIR):
+    """Whether corpus_dir holds a complete corpus of the books CSV as it is now."""
+    try:
+        with open(os.path.join(corpus_dir, CORPUS_FILE), encoding="utf-8") as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        return False
+    return info.get("version") == CORPUS_VERSION and all(
+        info.get(key) == value for key, value in source_stamp(books_path).items()
+    )
+
+
+def get_corpus(books_path, corpus_dir=CORPUS_DIR, chunk_size=50000):
+    """Load the corpus of a books CSV, building it first if it is missing or out of date.
+    :param books_path: Path to the books CSV
+    :param corpus_dir: Corpus directory
+    :param chunk_size: Number of CSV rows read at a time when building
+    :return: DescriptionCorpus
+    """
+    if corpus_is_current(books_path, corpus_dir):
+        return load_corpus(corpus_dir)
+    return build_corpus(books_path, corpus_dir, chunk_size)
@@ -1,81 +1,108 @@
 """Create a keyword-book matrix from the emoji-keyword mapping and book descriptions.
-This script generates a matrix where each row corresponds to a keyword (or its synonyms)"""
+This script generates a matrix where each row corresponds to a keyword (or its synonyms).
+It is a thin command line front end for IndexBuilder; installed, it is also available as
+the emoji-book-index command."""
 
-import pandas as pd
-import numpy as np
-from nltk.corpus import wordnet
 import argparse
-import gdown
-import zipfile
-import os
 
-parser = argparse.ArgumentParser(description="Create keyword-book matrix")
-parser.add_argument("-f", "--filepath", required=False, help="Path to user dataset", default=None)
-args = parser.parse_args()
+from .corpus import CORPUS_DIR
+from .index_builder import KEYWORD_PATH, MATRIX_DIR, POSTINGS_DIR, IndexBuilder, download_dataset
+from .synonyms import SYNONYMS_PATH
 
-# download and unzip dataset if not already in data folder
-if args.filepath is None:
-    url = "https://drive.google.com/uc?id=1Ai0rmMPnyJHcP1bTdFm0T89-UMJ3uOK_"
-    zip_path = "data.zip"
-    extract_dir = "emoji_book_rec/data"
 
-    if not os.path.exists(zip_path):
-        gdown.download(url, zip_path, quiet=False)
-
-    if not os.path.exists(extract_dir):
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-
-    args.filepath = os.path.join(extract_dir, "BooksDatasetClean.csv")
-
-
-def get_synonyms(word):
-    """Get a set of synonyms for a word using WordNet.
-    :param word: The word to find synonyms for.
-    :return: A set of synonyms for the word.
+def main(argv=None):
+    """Build the keyword-book matrix and save it to the data folder.
+    :param argv: Command line arguments, defaults to sys.argv[1:]
     """
-
-    synonyms = set()
-    for syn in wordnet.synsets(word):
-        for lemma in syn.lemmas():
-            synonyms.add(lemma.name().lower().replace("_", " "))
-    return synonyms
-
-
-# Load the emoji-keyword mapping
-emoji_keywords_df = pd.read_csv("emoji_book_rec/data/emoji_keyword_list.tsv", sep="\t")
-keywords = set()
-for _, row in emoji_keywords_df.iterrows():
-    for kw in row[1:]:
-        keywords.add(kw.lower())
-keywords = sorted(keywords)
-
-# Load the books data
-books_df = pd.read_csv(args.filepath)
-books_df = books_df[books_df["Description"].notna() & (books_df["Description"].str.strip() != "")]
-books = (books_df["Title"] + " " + books_df["Authors"]).tolist()
-
-# Initialize the 2D array
-keyword_matrix = np.zeros((len(keywords), len(books)), dtype=float)
-
-# Fill in the matrix
-synonym_cache = {}
-
-for i, kw in enumerate(keywords):
-    if kw not in synonym_cache:
-        synonym_cache[kw] = get_synonyms(kw) | {kw}  # include the keyword itself
-
-    synonyms = synonym_cache[kw]
-
-    for j, desc in enumerate(books_df["Description"].fillna("").str.lower()):
-        count = sum(desc.count(syn) for syn in synonyms)
-        if desc:
-            keyword_matrix[i, j] = float(count) / len(desc) * 100
-        else:
-            keyword_matrix[i, j] = count
-
-# Convert to DataFrame for easy inspection or export
-result_df = pd.DataFrame(keyword_matrix, index=keywords, columns=books)
-
-# Save to file
-result_df.to_csv("emoji_book_rec/data/keyword_book_matrix.tsv", sep="\t")
+    parser = argparse.ArgumentParser(description="Create keyword-book matrix")
+    parser.add_argument("-f", "--filepath", required=False, help="Path to user dataset", default=None)
+    parser.add_argument(
+        "--no-download",
+        action="store_true",
+        help="Fail instead of downloading the default dataset when no --filepath is given",
+    )
+    parser.add_argument(
+        "-k", "--keywords", default=KEYWORD_PATH, help=f"Emoji keyword list TSV (default: {KEYWORD_PATH})"
+    )
+    parser.add_argument(
+        "-o", "--out-dir", default=MATRIX_DIR, help=f"Matrix artifact directory (default: {MATRIX_DIR})"
+    )
+    parser.add_argument(
+        "-p", "--postings-dir", default=POSTINGS_DIR, help=f"Posting index directory (default: {POSTINGS_DIR})"
+    )
+    matching = parser.add_mutually_exclusive_group()
+    matching.add_argument(
+        "-w", "--word-boundary", action="store_true", help="Only count whole-word keyword hits (default: substrings)"
+    )
+    matching.add_argument(
+        "-t",
+        "--tokenize",
+        action="store_true",
+        help="Count exact keyword terms among word tokens, multi-word synonyms included (default: substrings)",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="Number of worker processes to score books with (default: 1)"
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Reuse the existing matrix and only score new or changed books",
+    )
+    parser.add_argument(
+        "-s",
+        "--synonyms",
+        default=SYNONYMS_PATH,
+        help=f"Path to the WordNet synonym cache, rebuilt when the keyword list changes (default: {SYNONYMS_PATH})",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk-size",
+        type=int,
+        default=50000,
+        help="Number of books read and scored at a time, bounds the memory of a full sparse build (default: 50000)",
+    )
+    parser.add_argument("--dense", action="store_true", help="Store the matrix dense instead of sparse")
+    parser.add_argument(
+        "--corpus-dir",
+        default=CORPUS_DIR,
+        help=f"Normalized description corpus, rebuilt when the dataset changes; '' to read the CSV directly "
+        f"(default: {CORPUS_DIR})",
+    )
+    args = parser.parse_args(argv)
+
+    # download and unzip dataset if not already in data folder
+    if args.filepath is None:
+        if args.no_download:
+            parser.error("--filepath is required with --no-download")
+        args.filepath = download_dataset()
+
+    builder = IndexBuilder(
+        args.filepath,
+        keyword_path=args.keywords,
+        out_dir=args.out_dir,
+        postings_dir=args.postings_dir,
+        synonym_path=args.synonyms,
+        word_boundary=args.word_boundary,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        incremental=args.incremental,
+        dense=args.dense,
+        corpus_dir=args.corpus_dir or None,
+        tokenize=args.tokenize,
+    )
+    summary = builder.build()
+
+    if summary["status"] == "up to date":
+        print("Keyword-book matrix is already up to date")
+        return
+    if summary["status"] == "updated":
+        print(f"Rescored {summary['n_keywords_scored']} of {summary['n_keywords']} keywords over unchanged books")
+    elif args.incremental:
+        print("No previous build found, rebuilt the whole matrix")
+    print(f"Scored {summary['n_scored']} of {summary['n_books']} books")
+
+
+if __name__ == "__main__":
+
+    main()
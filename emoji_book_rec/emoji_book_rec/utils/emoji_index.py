@@ -0,0 +1,239 @@
+"""Precomputed per-emoji scores for the keyword-book matrix.
+Every emoji maps to a fixed, weighted keyword list, so its contribution to every book's score can
+be computed once at build time. A query then only adds up the rows of its (at most 5) emojis, and
+the distinct-keyword bonus is a popcount of each book's keyword bitset masked by the query's keywords."""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from .atomic import replacing_dir, save_array, save_json
+from .bitsets import keyword_mask, n_words, popcount
+from .instrumentation import METRICS
+from .spill import SpillFile
+
+EMOJI_DIR = "emoji_index"
+EMOJIS_FILE = "emojis.json"
+SCORES_DATA_FILE = "scores_data.npy"
+SCORES_INDICES_FILE = "scores_indices.npy"
+SCORES_INDPTR_FILE = "scores_indptr.npy"
+KEYWORD_MASKS_FILE = "keyword_masks.npy"
+
+def keyword_dict_hash(emoji_kw_dict):
+    """Hash of the emoji -> weighted keyword lists the per-emoji scores were built from.
+    :param emoji_kw_dict: Dict from generate_keyword_dict
+    :return: Hex digest
+    """
+    payload = json.dumps(list(emoji_kw_dict.items()))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmojiIndex:
+    """Emoji x book score matrix and per-emoji keyword masks, next to the matrix's per-book keyword bitsets."""
+
+    def __init__(self, emojis, scores, keyword_masks, book_bits, keywords_hash):
+        """
+        :param emojis: List of emoji short texts, in row order
+        :param scores: CSR matrix (emojis x books) of each emoji's weighted term frequencies
+        :param keyword_masks: uint64 array (emojis x words), bits of the keywords each emoji uses
+        :param book_bits: uint64 array (books x words), KeywordBookMatrix.keyword_bits
+        :param keywords_hash: keyword_dict_hash of the emoji keyword lists used
+        """
+        self.emojis = list(emojis)
+        self.emoji_index = {e: i for i, e in enumerate(self.emojis)}
+        self.scores = scores
+        self.keyword_masks = keyword_masks
+        self.book_bits = book_bits
+        self.keywords_hash = keywords_hash
+
+    def query_rows(self, query):
+        """Rows of the emojis in a query, each counted once, in row order (like generate_keyword_dict order).
+        :param query: List of emoji short texts
+        :return: List of row numbers
+        """
+        return sorted({self.emoji_index[e] for e in query if e in self.emoji_index})
+
+    def score(self, query):
+        """Score every book for a query by adding up its emojis' precomputed rows.
+        :param query: List of emoji short texts
+        :return: Tuple of (scores, number of distinct keywords found), both arrays with one entry per book
+        """
+        rows = self.query_rows(query)
+        n_books = self.scores.shape[1]
+        scores = np.zeros(n_books)
+        distinct = np.zeros(n_books, dtype=np.int64)
+        if not rows:
+            return scores, distinct
+
+        with METRICS.span("scoring"):
+            # the transpose of a CSR slice is CSC, whose mat-vec adds one emoji row at a time
+            sub = self.scores[rows]
+            scores = sub.T @ np.ones(len(rows))
+            candidates = np.unique(sub.indices)
+
+        with METRICS.span("bonus"):
+            mask = np.bitwise_or.reduce(self.keyword_masks[rows], axis=0)
+            distinct[candidates] = popcount(self.book_bits[candidates] & mask)
+            scores = scores + 1.5 * distinct
+        return scores, distinct
+
+    def score_batch(self, queries):
+        """Score many queries with one product of a query x emoji matrix against the emoji rows.
+        Each query's emojis are added in the same order as in score, so the totals are identical.
+        :param queries: List of queries, each a list of emoji short texts
+        :return: CSR matrix (queries x books) of total scores, holding only the matched books
+        """
+        indices, indptr = [], [0]
+        masks = np.zeros((len(queries), self.keyword_masks.shape[1]), dtype=np.uint64)
+        for i, query in enumerate(queries):
+            rows = self.query_rows(query)
+            indices.extend(rows)
+            indptr.append(len(indices))
+            if rows:
+                masks[i] = np.bitwise_or.reduce(self.keyword_masks[rows], axis=0)
+        selection = sparse.csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(queries), len(self.emojis)),
+        )
+
+        totals = sparse.csr_matrix(selection @ self.scores)
+        totals.sort_indices()
+        for i in range(len(queries)):
+            start, end = totals.indptr[i], totals.indptr[i + 1]
+            cols = totals.indices[start:end]
+            totals.data[start:end] += 1.5 * popcount(self.book_bits[cols] & masks[i])
+        return totals
+
+
+def _emoji_score_rows(emoji_kw_dict, matrix):
+    """Compute the keyword mask and the scores of one emoji at a time.
+    Each emoji's scores are the counted sum of its keywords' matrix rows, so only those few rows are
+    read (from the memory-mapped matrix) rather than a copy of the whole matrix.
+    :param emoji_kw_dict: Dict from generate_keyword_dict (first keyword already weighted 3 times)
+    :param matrix: KeywordBookMatrix
+    :return: Generator of (keyword mask, 1 x books CSR matrix of scores), in emoji_kw_dict order
+    """
+    n_keywords, n_books = len(matrix.keywords), len(matrix.books)
+    for emoji in emoji_kw_dict:
+        counts = {}
+        for kw in emoji_kw_dict[emoji]:
+            if kw in matrix:
+                counts[kw] = counts.get(kw, 0) + 1
+        mask = keyword_mask([matrix.keyword_index[kw] for kw in counts], n_keywords)
+        if not counts:
+            yield mask, sparse.csr_matrix((1, n_books))
+            continue
+
+        entries = [matrix.row_entries(kw) for kw in counts]
+        rows = sparse.csr_matrix(
+            (
+                np.concatenate([values for _, values in entries]).astype(np.float64),
+                np.concatenate([cols for cols, _ in entries]),
+                np.concatenate([[0], np.cumsum([len(cols) for cols, _ in entries])]),
+            ),
+            shape=(len(entries), n_books),
+        )
+        # the keyword rows are added in the emoji's keyword order, weighted by their counts
+        scores = sparse.csr_matrix(np.array([list(counts.values())], dtype=np.float64)) @ rows
+        scores.sort_indices()
+        yield mask, scores
+
+
+def build_emoji_index(emoji_kw_dict, matrix):
+    """Precompute every emoji's scores and keyword bits from the keyword-book matrix.
+    :param emoji_kw_dict: Dict from generate_keyword_dict (first keyword already weighted 3 times)
+    :param matrix: KeywordBookMatrix
+    :return: EmojiIndex
+    """
+    emojis = list(emoji_kw_dict)
+    masks = np.zeros((len(emojis), n_words(len(matrix.keywords))), dtype=np.uint64)
+    rows = []
+    for e, (mask, scores) in enumerate(_emoji_score_rows(emoji_kw_dict, matrix)):
+        masks[e] = mask
+        rows.append(scores)
+    if rows:
+        scores = sparse.csr_matrix(sparse.vstack(rows, format="csr"))
+    else:
+        scores = sparse.csr_matrix((0, len(matrix.books)))
+    return EmojiIndex(emojis, scores, masks, matrix.keyword_bits, keyword_dict_hash(emoji_kw_dict))
+
+
+def write_emoji_index(matrix_dir, emoji_kw_dict, matrix):
+    """Build the emoji index of a matrix artifact and write it one emoji at a time.
+    Writes the same files as save_emoji_index(matrix_dir, build_emoji_index(emoji_kw_dict, matrix)), but only
+    one emoji's scores are held in memory at a time instead of the whole emoji x book matrix. The index
+    is built in a new directory that replaces the old one at the end, so engines never load a mix of both.
+    :param matrix_dir: Artifact directory of the matrix
+    :param emoji_kw_dict: Dict from generate_keyword_dict (first keyword already weighted 3 times)
+    :param matrix: KeywordBookMatrix loaded from matrix_dir
+    """
+    emojis = list(emoji_kw_dict)
+    masks = np.zeros((len(emojis), n_words(len(matrix.keywords))), dtype=np.uint64)
+    with replacing_dir(os.path.join(matrix_dir, EMOJI_DIR)) as out_dir:
+        data = SpillFile(os.path.join(out_dir, SCORES_DATA_FILE), np.float64)
+        indices = SpillFile(os.path.join(out_dir, SCORES_INDICES_FILE), np.int64)
+        indptr = [0]
+        for e, (mask, scores) in enumerate(_emoji_score_rows(emoji_kw_dict, matrix)):
+            masks[e] = mask
+            data.write(scores.data)
+            indices.write(scores.indices)
+            indptr.append(data.length)
+        data.close()
+        indices.close()
+        save_array(os.path.join(out_dir, SCORES_INDPTR_FILE), np.array(indptr, dtype=np.int64))
+        save_array(os.path.join(out_dir, KEYWORD_MASKS_FILE), masks)
+        save_json(
+            os.path.join(out_dir, EMOJIS_FILE),
+            {"emojis": emojis, "keywords_hash": keyword_dict_hash(emoji_kw_dict), "n_books": len(matrix.books)},
+        )
+
+
+def save_emoji_index(matrix_dir, index):
+    """Write the emoji index into a matrix artifact directory.
+    :param matrix_dir: Artifact directory of the matrix the index was built from
+    :param index: EmojiIndex
+    """
+    out_dir = os.path.join(matrix_dir, EMOJI_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    save_array(os.path.join(out_dir, SCORES_DATA_FILE), index.scores.data)
+    save_array(os.path.join(out_dir, SCORES_INDICES_FILE), index.scores.indices)
+    save_array(os.path.join(out_dir, SCORES_INDPTR_FILE), index.scores.indptr)
+    save_array(os.path.join(out_dir, KEYWORD_MASKS_FILE), index.keyword_masks)
+    save_json(
+        os.path.join(out_dir, EMOJIS_FILE),
+        {"emojis": index.emojis, "keywords_hash": index.keywords_hash, "n_books": index.scores.shape[1]},
+    )
+
+
+def load_emoji_index(matrix_dir, matrix):
+    """Load (memory-mapped) the emoji index of a matrix artifact.
+    :param matrix_dir: Artifact directory
+    :param matrix: KeywordBookMatrix loaded from the same directory
+    :return: EmojiIndex, or None if the artifact has none or it was built for another matrix
+    """
+    in_dir = os.path.join(matrix_dir, EMOJI_DIR)
+    if not os.path.exists(os.path.join(in_dir, EMOJIS_FILE)):
+        return None
+    with open(os.path.join(in_dir, EMOJIS_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("n_books") != len(matrix.books):
+        return None
+    scores = sparse.csr_matrix(
+        (
+            np.load(os.path.join(in_dir, SCORES_DATA_FILE), mmap_mode="r"),
+            np.load(os.path.join(in_dir, SCORES_INDICES_FILE), mmap_mode="r"),
+            np.load(os.path.join(in_dir, SCORES_INDPTR_FILE), mmap_mode="r"),
+        ),
+        shape=(len(meta["emojis"]), len(matrix.books)),
+        copy=False,
+    )
+    return EmojiIndex(
+        meta["emojis"],
+        scores,
+        np.load(os.path.join(in_dir, KEYWORD_MASKS_FILE)),
+        matrix.keyword_bits,
+        meta["keywords_hash"],
+    )
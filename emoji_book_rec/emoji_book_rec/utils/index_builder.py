@@ -0,0 +1,280 @@
+"""Build the keyword-book matrix and the indexes derived from it.
+IndexBuilder takes every input and option explicitly and has no side effects until build() is
+called, so the build can run from the command line (create_kw_book_tsv), tests, a service or a
+benchmark alike. Downloading the default dataset is a separate step (download_dataset), so
+offline builds against a local file never touch the network."""
+
+from collections import deque
+from datetime import datetime
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .atomic import replacing_dir
+from .corpus import book_labels, get_corpus, normalize, read_books
+from .emoji_index import keyword_dict_hash, load_emoji_index, write_emoji_index
+from .keyword_tsv_to_dict import generate_keyword_dict
+from .matrix_builder import fingerprint_books, keyword_hashes, score_chunks, update_keyword_matrix
+from .matrix_store import MatrixWriter, load_manifest, load_matrix, save_manifest, save_matrix
+from .postings import write_postings
+from .synonyms import SYNONYMS_PATH, expand_keywords
+
+DATA_DIR = "emoji_book_rec/data"
+KEYWORD_PATH = "emoji_book_rec/data/emoji_keyword_list.tsv"
+MATRIX_DIR = "emoji_book_rec/data/keyword_book_matrix"
+POSTINGS_DIR = "emoji_book_rec/data/keyword_postings"
+DATASET_URL = "https://drive.google.com/uc?id=1Ai0rmMPnyJHcP1bTdFm0T89-UMJ3uOK_"
+
+
+def download_dataset(extract_dir=DATA_DIR, zip_path="data.zip", url=DATASET_URL):
+    """Download and unzip the default books dataset if it is not already there.
+    :param extract_dir: Folder to unzip the dataset into
+    :param zip_path: Where the downloaded zip file is kept
+    :param url: Google Drive URL of the dataset
+    :return: Path to the books CSV
+    """
+    # imported here so builds against a local file do not need gdown
+    import gdown
+
+    if not os.path.exists(zip_path):
+        gdown.download(url, zip_path, quiet=False)
+
+    if not os.path.exists(extract_dir):
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(extract_dir)
+
+    return os.path.join(extract_dir, "BooksDatasetClean.csv")
+
+
+class IndexBuilder:
+    """Builds the keyword-book matrix artifact, its per-emoji scores and the posting lists."""
+
+    def __init__(
+        self,
+        books_path,
+        keyword_path=KEYWORD_PATH,
+        out_dir=MATRIX_DIR,
+        postings_dir=POSTINGS_DIR,
+        synonym_path=SYNONYMS_PATH,
+        word_boundary=False,
+        workers=1,
+        chunk_size=50000,
+        incremental=False,
+        dense=False,
+        corpus_dir=None,
+        tokenize=False,
+    ):
+        """
+        :param books_path: Path to the books CSV (Title, Authors and Description columns)
+        :param keyword_path: Path to the emoji keyword list TSV
+        :param out_dir: Matrix artifact directory to write
+        :param postings_dir: Posting index directory to write, or None to skip it
+        :param synonym_path: Path to the WordNet synonym cache, or None to always use WordNet
+        :param word_boundary: If True, only count whole-word keyword hits
+        :param workers: Number of worker processes to score books with
+        :param chunk_size: Number of books read and scored at a time
+        :param incremental: If True, reuse the existing matrix and only score new or changed books
+        :param dense: If True, store the matrix dense (matrix.npy) instead of as sparse CSR arrays
+        :param corpus_dir: Normalized description corpus to read books from (built or refreshed from
+            books_path as needed), or None to parse the CSV on every build
+        :param tokenize: If True, count exact keyword terms among word tokens (multi-word synonyms
+            as n-grams) instead of substrings; implies whole words
+        """
+        self.books_path = books_path
+        self.keyword_path = keyword_path
+        self.out_dir = out_dir
+        self.postings_dir = postings_dir
+        self.synonym_path = synonym_path
+        self.word_boundary = word_boundary
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.dense = dense
+        self.corpus_dir = corpus_dir
+        self.tokenize = tokenize
+
+    def load_keywords(self):
+        """Read every keyword of the emoji keyword list.
+        :return: Sorted list of lowercased keywords
+        """
+        emoji_keywords_df = pd.read_csv(self.keyword_path, sep="\t")
+        keywords = set()
+        for _, row in emoji_keywords_df.iterrows():
+            for kw in row[1:]:
+                keywords.add(kw.lower())
+        return sorted(keywords)
+
+    def build(self):
+        """Build (or bring up to date) every artifact.
+        :return: Dict summing up the build: status ("built", "updated" or "up to date"), n_books,
+            n_scored (books scored), n_keywords, n_keywords_scored and nnz
+        """
+        keywords = self.load_keywords()
+        # every synonym of every keyword goes into one matcher, so each description is scanned once
+        # synonyms come from the cache file, WordNet is only loaded for keywords it does not have yet
+        expanded_keywords = expand_keywords(keywords, self.synonym_path)
+        hashes = keyword_hashes(expanded_keywords, self.word_boundary, self.tokenize)
+        # parsing and case folding the CSV is only done when it changed since the corpus was written
+        corpus = get_corpus(self.books_path, self.corpus_dir, self.chunk_size) if self.corpus_dir else None
+
+        manifest, old_fingerprints = load_manifest(self.out_dir) if self.incremental else (None, None)
+        update = manifest is not None and "keyword_hashes" in manifest and manifest.get("dense", False) == self.dense
+        if update:
+            # old and new book columns are lined up by fingerprint, so the whole book list is loaded here
+            books, descriptions, fingerprints = self._read_all(corpus)
+            if manifest["keyword_hashes"] == hashes and np.array_equal(old_fingerprints, fingerprints):
+                self._write_derived(self.out_dir, load_matrix(self.out_dir), only_stale=True)
+                return {
+                    "status": "up to date",
+                    "n_books": len(books),
+                    "n_scored": 0,
+                    "n_keywords": len(hashes),
+                    "n_keywords_scored": 0,
+                    "nnz": manifest["nnz"],
+                }
+
+        # written into a new directory that replaces out_dir once complete, so engines serving the
+        # previous artifact keep it (and never load a half-written one) until then
+        with replacing_dir(self.out_dir) as build_dir:
+            if update:
+                summary = self._update(
+                    build_dir, expanded_keywords, manifest, old_fingerprints, books, descriptions, fingerprints
+                )
+            else:
+                summary, fingerprints = self._build_all(build_dir, expanded_keywords, corpus)
+
+            save_manifest(
+                build_dir,
+                {
+                    "created": datetime.now().isoformat(),
+                    "source": self.books_path,
+                    "keyword_hashes": hashes,
+                    "word_boundary": self.word_boundary,
+                    "tokenize": self.tokenize,
+                    "dense": self.dense,
+                    "n_keywords": len(keywords),
+                    "n_books": summary["n_books"],
+                    "nnz": summary["nnz"],
+                },
+                fingerprints,
+            )
+            self._write_derived(build_dir, load_matrix(build_dir))
+        return summary
+
+    def _read_chunks(self, corpus):
+        """Yield (book labels, normalized descriptions, fingerprints) a chunk of books at a time."""
+        if corpus is not None:
+            for start, end in corpus.chunks(self.chunk_size):
+                books = [corpus.books[j] for j in range(start, end)]
+                yield books, corpus.chunk(start, end), corpus.fingerprints[start:end]
+            return
+        for books_df in read_books(self.books_path, self.chunk_size):
+            books = book_labels(books_df)
+            descriptions = books_df["Description"]
+            yield books, normalize(descriptions), fingerprint_books(books, descriptions.tolist())
+
+    def _read_all(self, corpus):
+        """Read every book at once.
+        :return: Tuple of (book labels, normalized descriptions, fingerprints array)
+        """
+        books, descriptions, fingerprints = [], [], []
+        for chunk_books, chunk_descriptions, chunk_fingerprints in self._read_chunks(corpus):
+            books += chunk_books
+            descriptions += chunk_descriptions
+            fingerprints.append(chunk_fingerprints)
+        fingerprints = np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint64)
+        return books, descriptions, fingerprints
+
+    def _build_all(self, out_dir, expanded_keywords, corpus=None):
+        """Score every book, one chunk at a time, writing the matrix into out_dir."""
+        keywords = list(expanded_keywords)
+        chunk_books = deque()
+        fingerprints = []
+
+        def description_chunks():
+            for books, descriptions, chunk_fingerprints in self._read_chunks(corpus):
+                chunk_books.append(books)
+                fingerprints.append(chunk_fingerprints)
+                yield descriptions
+
+        # books are scored in contiguous shards across the worker processes
+        blocks = score_chunks(
+            expanded_keywords,
+            description_chunks(),
+            workers=self.workers,
+            word_boundary=self.word_boundary,
+            tokenize=self.tokenize,
+        )
+        if self.dense:
+            # a dense matrix has no use for streaming, it is as large as keywords x books anyway
+            blocks = list(blocks)
+            books = [book for chunk in chunk_books for book in chunk]
+            matrix = sparse.hstack(blocks, format="csr") if blocks else sparse.csr_matrix((len(keywords), 0))
+            save_matrix(out_dir, matrix.toarray(), keywords, books)
+            n_books, nnz = len(books), matrix.nnz
+        else:
+            # The matrix is mostly zeros (a keyword shows up in very few descriptions), so it is kept as
+            # sparse CSR arrays, written block by block so memory is bounded by the chunk size
+            # (the derived indexes are then written one keyword or emoji row at a time)
+            writer = MatrixWriter(out_dir, keywords)
+            for block in blocks:
+                writer.append(block, chunk_books.popleft())
+            writer.close()
+            n_books, nnz = writer.n_books, writer.nnz
+
+        fingerprints = np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint64)
+        summary = {
+            "status": "built",
+            "n_books": n_books,
+            "n_scored": n_books,
+            "n_keywords": len(keywords),
+            "n_keywords_scored": len(keywords),
+            "nnz": int(nnz),
+        }
+        return summary, fingerprints
+
+    def _update(self, out_dir, expanded_keywords, manifest, old_fingerprints, books, descriptions, fingerprints):
+        """Score only new or changed keywords and books, copying the rest from the existing matrix
+        and writing the result into out_dir."""
+        old = load_matrix(self.out_dir)
+        matrix, n_keywords_scored, n_scored = update_keyword_matrix(
+            old.matrix if old.is_sparse else sparse.csr_matrix(np.asarray(old.matrix)),
+            manifest["keyword_hashes"],
+            old_fingerprints,
+            expanded_keywords,
+            descriptions,
+            fingerprints,
+            workers=self.workers,
+            word_boundary=self.word_boundary,
+            tokenize=self.tokenize,
+        )
+        del old
+        save_matrix(out_dir, matrix.toarray() if self.dense else matrix, list(expanded_keywords), books)
+        return {
+            "status": "updated",
+            "n_books": len(books),
+            "n_scored": n_scored,
+            "n_keywords": len(expanded_keywords),
+            "n_keywords_scored": n_keywords_scored,
+            "nnz": int(matrix.nnz),
+        }
+
+    def _write_derived(self, matrix_dir, matrix, only_stale=False):
+        """Write the per-emoji scores and the posting lists of a freshly written matrix.
+        :param matrix_dir: Matrix artifact directory the emoji index goes into
+        :param matrix: KeywordBookMatrix loaded from matrix_dir
+        :param only_stale: If True, only write what is missing or built for another keyword list
+        """
+        # every emoji's weighted keyword scores summed once here, so a query only adds up its emojis' rows
+        emoji_kw_dict = generate_keyword_dict(self.keyword_path)
+        emoji_index = load_emoji_index(matrix_dir, matrix) if only_stale else None
+        # the emoji weights can change without changing the set of keywords
+        if emoji_index is None or emoji_index.keywords_hash != keyword_dict_hash(emoji_kw_dict):
+            write_emoji_index(matrix_dir, emoji_kw_dict, matrix)
+
+        # the same scores as compressed per-keyword posting lists, for process_query(use_precomputed=False)
+        if self.postings_dir and not (only_stale and os.path.exists(self.postings_dir)):
+            write_postings(self.postings_dir, matrix)
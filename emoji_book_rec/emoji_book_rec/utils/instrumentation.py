@@ -0,0 +1,168 @@
+"""Opt-in timing spans, counters and histograms for the query pipeline.
+Each stage of a query (keyword lookup, scoring, bonus, top-k, rendering) runs inside a named
+span, whose duration goes into a histogram, and events such as queries and cache hits bump
+counters. Everything is off by default: a disabled span is a shared no-op, so the hot path pays
+one attribute check. Turn it on with METRICS.enable() or EMOJI_BOOK_METRICS=1 in the
+environment, and read it back with snapshot() (JSON) or to_prometheus() (Prometheus text)."""
+
+from bisect import bisect_left
+from contextlib import nullcontext
+import json
+import os
+import threading
+import time
+
+# upper bounds (seconds) of the span duration histogram buckets, from 50 µs to 10 s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# returned by span() while disabled
+_NO_SPAN = nullcontext()
+
+
+class Histogram:
+    """Counts of observed values per bucket, plus their number and sum."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: Sorted upper bounds of the buckets; values above the last go in +Inf
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        # a value equal to a bound belongs to that bucket (le = less or equal)
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """(upper bound, number of values at or below it) for every bucket, ending with +Inf."""
+        total, out = 0, []
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {("+Inf" if bound == float("inf") else repr(bound)): n for bound, n in self.cumulative()},
+        }
+
+
+class _Span:
+    """Times one run of a stage into its histogram."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Thread-safe registry of counters and span duration histograms."""
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        """
+        :param enabled: Whether spans and counters record anything
+        :param buckets: Histogram bucket upper bounds, in seconds
+        """
+        self.enabled = enabled
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        # the GUI worker thread and the service executor may record at the same time
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def span(self, name):
+        """Context manager timing a stage.
+        :param name: Stage name, e.g. "scoring"
+        :return: Context manager (a shared no-op while disabled)
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def inc(self, name, value=1):
+        """Add to a counter.
+        :param name: Counter name, e.g. "queries"
+        :param value: Amount to add
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record one duration of a stage.
+        :param name: Stage name
+        :param seconds: Duration
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """Current counters and histograms as a JSON-serializable dict.
+        :return: Dict with "counters" (name -> value) and "spans" (name -> count, sum and cumulative buckets)
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "spans": {name: h.to_dict() for name, h in sorted(self.histograms.items())},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1)
+
+    def to_prometheus(self, prefix="emoji_book_rec"):
+        """Current counters and histograms in the Prometheus text exposition format.
+        Counters become <prefix>_<name>_total, spans one <prefix>_span_seconds histogram labelled by span.
+        :param prefix: Metric name prefix
+        :return: String
+        """
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            if self.histograms:
+                family = f"{prefix}_span_seconds"
+                lines.append(f"# TYPE {family} histogram")
+                for name, h in sorted(self.histograms.items()):
+                    for bound, n in h.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f'{family}_bucket{{span="{name}",le="{le}"}} {n}')
+                    lines.append(f'{family}_sum{{span="{name}"}} {h.sum!r}')
+                    lines.append(f'{family}_count{{span="{name}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+# the registry the query pipeline records into
+METRICS = Metrics(enabled=os.environ.get("EMOJI_BOOK_METRICS", "") not in ("", "0"))
@@ -0,0 +1,224 @@
+"""Multi-pattern keyword matchers for book descriptions.
+KeywordMatcher compiles all synonym strings of all keywords into one Aho-Corasick automaton, so a
+description is scanned once instead of once per synonym. TokenMatcher instead splits descriptions
+into word tokens and looks each token (and the n-grams multi-word synonyms need) up in a hash
+table, so it only counts exact terms and its cost grows with the number of tokens."""
+
+from collections import deque
+import re
+
+# a token is a run of word characters, the same characters the regex \b boundary is defined by
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _is_word_char(ch):
+    """Same definition of a word character as the regex \\b boundary."""
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordMatcher:
+    """Counts keyword (and synonym) occurrences in a text in a single pass.
+
+    Counts follow str.count semantics: each synonym's non-overlapping occurrences are counted
+    left to right and the counts of all of a keyword's synonyms are added up, exactly like
+    sum(desc.count(syn) for syn in synonyms). With word_boundary=True a hit only counts when
+    it is not part of a longer word, like re.findall(r"\\bsyn\\b", desc).
+    """
+
+    def __init__(self, expanded_keywords, word_boundary=False):
+        """
+        :param expanded_keywords: Dict mapping each keyword to the set of strings (synonyms) to count for it
+        :param word_boundary: If True, only count whole-word hits
+        """
+        self.keywords = list(expanded_keywords)
+        self.word_boundary = word_boundary
+
+        # a synonym shared by several keywords is matched once and credited to all of them
+        pattern_ids = {}
+        self.patterns = []
+        self.pattern_keywords = []
+        for kw_id, kw in enumerate(self.keywords):
+            for syn in sorted(expanded_keywords[kw]):
+                if not syn:
+                    continue
+                if syn not in pattern_ids:
+                    pattern_ids[syn] = len(self.patterns)
+                    self.patterns.append(syn)
+                    self.pattern_keywords.append([])
+                self.pattern_keywords[pattern_ids[syn]].append(kw_id)
+        self.pattern_lengths = [len(p) for p in self.patterns]
+
+        self._build()
+
+    def _build(self):
+        """Build the trie, its failure links and the merged output lists."""
+        goto = [{}]
+        out = [[]]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(pid)
+
+        # breadth-first, so a state's failure target is always finished before the state itself
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def pattern_counts(self, text):
+        """Count the non-overlapping occurrences of every pattern in a text.
+        :param text: Text to scan (already lowercased)
+        :return: Dict mapping pattern id to its count, only for patterns that occur
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        lengths = self.pattern_lengths
+        word_boundary = self.word_boundary
+        n = len(text)
+
+        counts = {}
+        last_end = {}
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            end = i + 1
+            for pid in out[state]:
+                start = end - lengths[pid]
+                if word_boundary and (
+                    (start > 0 and _is_word_char(text[start - 1])) or (end < n and _is_word_char(text[end]))
+                ):
+                    continue
+                # str.count resumes after each hit, so an overlapping hit of the same pattern is skipped
+                if start < last_end.get(pid, 0):
+                    continue
+                last_end[pid] = end
+                counts[pid] = counts.get(pid, 0) + 1
+        return counts
+
+    def count(self, text):
+        """Count every keyword in a text.
+        :param text: Text to scan (already lowercased)
+        :return: Dict mapping keyword index (position in self.keywords) to its count, only for keywords that occur
+        """
+        kw_counts = {}
+        for pid, c in self.pattern_counts(text).items():
+            for kw_id in self.pattern_keywords[pid]:
+                kw_counts[kw_id] = kw_counts.get(kw_id, 0) + c
+        return kw_counts
+
+
+class TokenMatcher:
+    """Counts exact keyword (and synonym) terms among a text's word tokens.
+
+    Synonyms are tokenized like the text, so "ice cream" is the token bigram (ice, cream) and
+    matches "ice cream", "ice-cream" or "ice  cream" but never "nice creamery", and "fun" never
+    matches "funeral". Each synonym's non-overlapping hits are counted left to right and the
+    counts of all of a keyword's synonyms are added up, as with KeywordMatcher.
+    """
+
+    def __init__(self, expanded_keywords):
+        """
+        :param expanded_keywords: Dict mapping each keyword to the set of strings (synonyms) to count for it
+        """
+        self.keywords = list(expanded_keywords)
+
+        # only tokens that occur in some synonym get an id; every other token breaks n-grams
+        self.vocabulary = {}
+        # synonym as a tuple of token ids -> pattern id
+        self.patterns = {}
+        self.pattern_keywords = []
+        for kw_id, kw in enumerate(self.keywords):
+            for syn in sorted(expanded_keywords[kw]):
+                tokens = TOKEN_PATTERN.findall(syn)
+                if not tokens:
+                    continue
+                key = tuple(self.vocabulary.setdefault(t, len(self.vocabulary)) for t in tokens)
+                if key not in self.patterns:
+                    self.patterns[key] = len(self.pattern_keywords)
+                    self.pattern_keywords.append([])
+                # a term shared by several keywords is matched once and credited to each of them once
+                if kw_id not in self.pattern_keywords[self.patterns[key]]:
+                    self.pattern_keywords[self.patterns[key]].append(kw_id)
+
+        # n-grams that start a longer synonym, so a lookup only grows while it can still match
+        self._prefixes = {key[:n] for key in self.patterns for n in range(1, len(key))}
+
+    def token_ids(self, text):
+        """Turn a text into token ids, -1 for tokens that are in no synonym.
+        :param text: Text to tokenize (already lowercased)
+        :return: List of token ids
+        """
+        vocabulary = self.vocabulary
+        return [vocabulary.get(token, -1) for token in TOKEN_PATTERN.findall(text)]
+
+    def pattern_counts(self, text):
+        """Count the non-overlapping occurrences of every pattern in a text.
+        :param text: Text to scan (already lowercased)
+        :return: Dict mapping pattern id to its count, only for patterns that occur
+        """
+        patterns, prefixes = self.patterns, self._prefixes
+        ids = self.token_ids(text)
+        n = len(ids)
+
+        counts = {}
+        last_end = {}
+        for i, token in enumerate(ids):
+            if token < 0:
+                continue
+            key = (token,)
+            end = i + 1
+            while True:
+                pid = patterns.get(key)
+                # like str.count, a hit overlapping the previous hit of the same pattern is skipped
+                if pid is not None and i >= last_end.get(pid, 0):
+                    last_end[pid] = end
+                    counts[pid] = counts.get(pid, 0) + 1
+                if key not in prefixes or end >= n or ids[end] < 0:
+                    break
+                key += (ids[end],)
+                end += 1
+        return counts
+
+    def count(self, text):
+        """Count every keyword in a text.
+        :param text: Text to scan (already lowercased)
+        :return: Dict mapping keyword index (position in self.keywords) to its count, only for keywords that occur
+        """
+        kw_counts = {}
+        for pid, c in self.pattern_counts(text).items():
+            for kw_id in self.pattern_keywords[pid]:
+                kw_counts[kw_id] = kw_counts.get(kw_id, 0) + c
+        return kw_counts
+
+
+def make_matcher(expanded_keywords, word_boundary=False, tokenize=False):
+    """Build the matcher for a set of matching options.
+    :param expanded_keywords: Dict mapping each keyword to the set of strings (synonyms) to count for it
+    :param word_boundary: If True, only count whole-word hits (implied by tokenize)
+    :param tokenize: If True, count exact terms among word tokens (TokenMatcher)
+    :return: KeywordMatcher or TokenMatcher
+    """
+    if tokenize:
+        return TokenMatcher(expanded_keywords)
+    return KeywordMatcher(expanded_keywords, word_boundary=word_boundary)
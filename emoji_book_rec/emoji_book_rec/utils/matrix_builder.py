@@ -0,0 +1,234 @@
+"""Score book descriptions against the keyword list and assemble the keyword-book matrix.
+Descriptions are split into contiguous shards of books, each shard is scored into a column
+block (in a worker process when workers > 1) and the blocks are stitched back together in order.
+A stream of description chunks can be scored block by block (score_chunks) for builds that
+should not hold the whole dataset in memory. An existing matrix can also be updated in place of
+a rebuild, scoring only the keyword rows and book columns that are new or changed."""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+
+import numpy as np
+from scipy import sparse
+
+from .matcher import make_matcher
+
+# the matcher each worker process builds once and reuses for all of its shards
+_worker_matcher = None
+
+
+def score_descriptions(matcher, descriptions):
+    """Score a block of descriptions.
+    :param matcher: KeywordMatcher or TokenMatcher over the keyword list
+    :param descriptions: List of lowercased descriptions, one per book
+    :return: CSR matrix with one row per keyword and one column per description
+    """
+    rows = []
+    cols = []
+    data = []
+    for j, desc in enumerate(descriptions):
+        for i, count in matcher.count(desc).items():
+            rows.append(i)
+            cols.append(j)
+            if desc:
+                data.append(float(count) / len(desc) * 100)
+            else:
+                data.append(count)
+
+    return sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+        shape=(len(matcher.keywords), len(descriptions)),
+    )
+
+
+def _init_worker(expanded_keywords, word_boundary, tokenize):
+    global _worker_matcher
+    _worker_matcher = make_matcher(expanded_keywords, word_boundary=word_boundary, tokenize=tokenize)
+
+
+def _score_shard(descriptions):
+    return score_descriptions(_worker_matcher, descriptions)
+
+
+def shard_ranges(n_books, n_shards):
+    """Split n_books into at most n_shards contiguous (start, end) ranges of near equal size.
+    :param n_books: Number of books
+    :param n_shards: Number of shards wanted
+    :return: List of (start, end) ranges
+    """
+    n_shards = max(1, min(n_shards, n_books))
+    bounds = np.linspace(0, n_books, n_shards + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def build_keyword_matrix(
+    expanded_keywords, descriptions, workers=1, word_boundary=False, shards_per_worker=4, tokenize=False
+):
+    """Build the keyword-book matrix, optionally across a pool of worker processes.
+    Every cell is computed the same way whichever shard it lands in, and the column blocks are
+    stitched in book order, so the output is identical for any number of workers.
+    :param expanded_keywords: Dict mapping each keyword (in row order) to the strings to count for it
+    :param descriptions: List of lowercased descriptions, in column order
+    :param workers: Number of worker processes; 1 scores everything in this process
+    :param word_boundary: If True, only count whole-word hits
+    :param shards_per_worker: Shards per worker, more shards evens out uneven description lengths
+    :param tokenize: If True, count exact terms among word tokens instead of substrings
+    :return: CSR matrix with one row per keyword and one column per book
+    """
+    if workers <= 1 or len(descriptions) < 2:
+        matcher = make_matcher(expanded_keywords, word_boundary=word_boundary, tokenize=tokenize)
+        return score_descriptions(matcher, descriptions)
+
+    ranges = shard_ranges(len(descriptions), workers * shards_per_worker)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(expanded_keywords, word_boundary, tokenize)
+    ) as pool:
+        blocks = list(pool.map(_score_shard, (descriptions[a:b] for a, b in ranges)))
+
+    return sparse.hstack(blocks, format="csr")
+
+
+def score_chunks(
+    expanded_keywords, description_chunks, workers=1, word_boundary=False, shards_per_worker=4, tokenize=False
+):
+    """Score a stream of description chunks, yielding one column block per chunk, in order.
+    Only one chunk is held at a time, and with workers > 1 a single process pool is kept for
+    the whole stream, each chunk being split into shards like in build_keyword_matrix.
+    :param expanded_keywords: Dict mapping each keyword (in row order) to the strings to count for it
+    :param description_chunks: Iterable of lists of lowercased descriptions
+    :param workers: Number of worker processes; 1 scores everything in this process
+    :param word_boundary: If True, only count whole-word hits
+    :param shards_per_worker: Shards per worker and chunk
+    :param tokenize: If True, count exact terms among word tokens instead of substrings
+    :return: Generator of CSR matrices, one row per keyword and one column per description of the chunk
+    """
+    if workers <= 1:
+        matcher = make_matcher(expanded_keywords, word_boundary=word_boundary, tokenize=tokenize)
+        for descriptions in description_chunks:
+            yield score_descriptions(matcher, descriptions)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(expanded_keywords, word_boundary, tokenize)
+    ) as pool:
+        for descriptions in description_chunks:
+            ranges = shard_ranges(len(descriptions), workers * shards_per_worker)
+            blocks = list(pool.map(_score_shard, (descriptions[a:b] for a, b in ranges)))
+            if blocks:
+                yield sparse.hstack(blocks, format="csr")
+            else:
+                yield sparse.csr_matrix((len(expanded_keywords), 0), dtype=np.float32)
+
+
+def fingerprint_books(books, descriptions):
+    """Fingerprint every book row so unchanged books can be recognized on the next build.
+    :param books: List of book labels ("Title Authors")
+    :param descriptions: List of raw descriptions, same order as books
+    :return: uint64 array with one fingerprint per book
+    """
+    fingerprints = np.empty(len(books), dtype=np.uint64)
+    for j, (book, desc) in enumerate(zip(books, descriptions)):
+        digest = hashlib.blake2b(f"{book}\0{desc}".encode("utf-8"), digest_size=8).digest()
+        fingerprints[j] = int.from_bytes(digest, "little")
+    return fingerprints
+
+
+def keyword_hashes(expanded_keywords, word_boundary=False, tokenize=False):
+    """Hash each keyword's synonym expansion, so a build can tell which matrix rows changed.
+    The matching options are part of every hash, since changing them changes every row.
+    :param expanded_keywords: Dict mapping each keyword (in row order) to the strings to count for it
+    :param word_boundary: Whether whole-word matching is used
+    :param tokenize: Whether token matching is used
+    :return: Dict mapping each keyword (in row order) to a hex digest
+    """
+    hashes = {}
+    for kw, syns in expanded_keywords.items():
+        options = {"keyword": kw, "synonyms": sorted(syns), "word_boundary": word_boundary}
+        # only added when on, so the hashes of earlier (substring or whole-word) builds still match
+        if tokenize:
+            options["tokenize"] = True
+        payload = json.dumps(options)
+        hashes[kw] = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    return hashes
+
+
+def update_keyword_matrix(
+    old_matrix,
+    old_keyword_hashes,
+    old_fingerprints,
+    expanded_keywords,
+    descriptions,
+    fingerprints,
+    workers=1,
+    word_boundary=False,
+    tokenize=False,
+):
+    """Bring an existing matrix up to date with a new keyword list and a new book list.
+    A cell is copied from the old matrix when neither its keyword (with its synonyms) nor its book
+    changed. New or changed keywords are scored over the unchanged books, new or changed books are
+    scored for every keyword, and dropped keywords and books are left out. The result equals a
+    full rebuild.
+    :param old_matrix: CSR matrix from the previous build
+    :param old_keyword_hashes: keyword_hashes of the previous build, in row order
+    :param old_fingerprints: Fingerprints of the previous build's books, in column order
+    :param expanded_keywords: Dict mapping each keyword (in row order) to the strings to count for it
+    :param descriptions: List of lowercased descriptions of the new book list, in column order
+    :param fingerprints: Fingerprints of the new book list, in column order
+    :param workers: Number of worker processes for scoring
+    :param word_boundary: If True, only count whole-word hits
+    :param tokenize: If True, count exact terms among word tokens instead of substrings
+    :return: Tuple of (CSR matrix, number of keyword rows rescored, number of book columns rescored)
+    """
+    keywords = list(expanded_keywords)
+    hashes = keyword_hashes(expanded_keywords, word_boundary, tokenize)
+    old_rows = {kw: i for i, kw in enumerate(old_keyword_hashes)}
+
+    kept_rows_new, kept_rows_old, scored_rows = [], [], []
+    for i, kw in enumerate(keywords):
+        if old_keyword_hashes.get(kw) == hashes[kw]:
+            kept_rows_new.append(i)
+            kept_rows_old.append(old_rows[kw])
+        else:
+            scored_rows.append(i)
+
+    old_columns = {}
+    for k, fp in enumerate(old_fingerprints.tolist()):
+        old_columns.setdefault(fp, k)
+
+    kept_new, kept_old, scored_new = [], [], []
+    for j, fp in enumerate(fingerprints.tolist()):
+        k = old_columns.get(fp)
+        if k is None:
+            scored_new.append(j)
+        else:
+            kept_new.append(j)
+            kept_old.append(k)
+
+    # unchanged books: copy the unchanged keyword rows, score only the new or changed keywords
+    kept = sparse.csr_matrix(old_matrix)[kept_rows_old][:, kept_old]
+    rescored = build_keyword_matrix(
+        {keywords[i]: expanded_keywords[keywords[i]] for i in scored_rows},
+        [descriptions[j] for j in kept_new],
+        workers=workers,
+        word_boundary=word_boundary,
+        tokenize=tokenize,
+    )
+    row_order = np.argsort(np.array(kept_rows_new + scored_rows, dtype=np.int64), kind="stable")
+    kept_books = sparse.vstack([kept, rescored], format="csr")[row_order]
+
+    # new or changed books: score every keyword
+    scored = build_keyword_matrix(
+        expanded_keywords,
+        [descriptions[j] for j in scored_new],
+        workers=workers,
+        word_boundary=word_boundary,
+        tokenize=tokenize,
+    )
+
+    # the blocks hold the kept columns then the scored ones; put every column back at its book's position
+    combined = sparse.hstack([kept_books, scored], format="csc")
+    order = np.argsort(np.array(kept_new + scored_new, dtype=np.int64), kind="stable")
+    matrix = combined[:, order].tocsr()
+    matrix.sort_indices()
+    return matrix, len(scored_rows), len(scored_new)
@@ -0,0 +1,302 @@
+"""Save and load the keyword-book matrix as a binary artifact.
+The artifact is a directory holding the float32 matrix as .npy files next to the keyword
+table and the book catalogue, so loading it is a memory map instead of a text parse. The matrix is stored
+either dense (matrix.npy) or as the three CSR arrays (data.npy, indices.npy, indptr.npy), with
+the keywords found in each book packed into bitsets (keyword_bits.npy)."""
+
+import json
+import os
+import shutil
+
+import numpy as np
+from scipy import sparse
+
+from .atomic import save_array, save_json
+from .bitsets import book_keyword_bits, keyword_mask, mask_rows, n_words
+from .catalogue import LABELS_FILE as CATALOGUE_LABELS_FILE
+from .catalogue import OFFSETS_FILE as CATALOGUE_OFFSETS_FILE
+from .catalogue import BookCatalogue, catalogue_exists, load_catalogue, save_catalogue
+from .emoji_index import EMOJI_DIR
+from .spill import copy_raw, new_array
+
+MATRIX_FILE = "matrix.npy"
+CSR_DATA_FILE = "data.npy"
+CSR_INDICES_FILE = "indices.npy"
+CSR_INDPTR_FILE = "indptr.npy"
+KEYWORDS_FILE = "keywords.json"
+BOOKS_FILE = "books.json"
+MANIFEST_FILE = "manifest.json"
+FINGERPRINTS_FILE = "fingerprints.npy"
+KEYWORD_BITS_FILE = "keyword_bits.npy"
+BLOCKS_DIR = "blocks.tmp"
+
+
+class KeywordBookMatrix:
+    """Keyword-book matrix with its row (keyword) and column (book) labels."""
+
+    def __init__(self, matrix, keywords, books, keyword_bits=None):
+        """
+        :param matrix: 2D array or scipy CSR matrix with one row per keyword and one column per book
+        :param keywords: List of keywords, in row order
+        :param books: BookCatalogue or list of book labels ("Title Authors"), in column order
+        :param keyword_bits: Packed keyword bitsets per book (from book_keyword_bits), computed if not given
+        """
+        if matrix.shape != (len(keywords), len(books)):
+            raise ValueError(
+                f"Matrix shape {matrix.shape} does not match {len(keywords)} keywords x {len(books)} books"
+            )
+        self.matrix = matrix
+        self.keywords = list(keywords)
+        # column numbers are the book ids, labels are only decoded for books that get shown
+        self.books = BookCatalogue.from_labels(books)
+        self.keyword_index = {kw: i for i, kw in enumerate(self.keywords)}
+        self.keyword_bits = book_keyword_bits(matrix) if keyword_bits is None else keyword_bits
+
+    def __contains__(self, keyword):
+        return keyword in self.keyword_index
+
+    @property
+    def is_sparse(self):
+        return sparse.issparse(self.matrix)
+
+    def row(self, keyword):
+        """Get the scores of every book for one keyword.
+        :param keyword: Keyword to look up
+        :return: 1D dense array of scores, one per book
+        """
+        i = self.keyword_index[keyword]
+        if self.is_sparse:
+            return self.matrix[i].toarray().ravel()
+        return self.matrix[i]
+
+    def row_entries(self, keyword):
+        """Get the books with a nonzero score for one keyword.
+        :param keyword: Keyword to look up
+        :return: Tuple of (book column indices, scores), in column order
+        """
+        i = self.keyword_index[keyword]
+        if self.is_sparse:
+            start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+            return self.matrix.indices[start:end], self.matrix.data[start:end]
+        row = self.matrix[i]
+        cols = np.flatnonzero(row)
+        return cols, row[cols]
+
+    def keyword_mask(self, keywords):
+        """Pack a set of keywords into a bitset comparable with keyword_bits.
+        :param keywords: Iterable of keywords; ones not in the matrix are skipped
+        :return: 1D uint64 array of words
+        """
+        return keyword_mask((self.keyword_index[kw] for kw in keywords if kw in self), len(self.keywords))
+
+    def keywords_found(self, book, mask):
+        """Reconstruct which of the keywords in a mask were found in one book.
+        :param book: Column index of the book
+        :param mask: Bitset from keyword_mask
+        :return: List of keywords, in row order
+        """
+        return [self.keywords[i] for i in mask_rows(self.keyword_bits[book] & mask)]
+
+
+def _clear_artifact(out_dir):
+    """Create the artifact directory, removing the files of a previous build from it."""
+    os.makedirs(out_dir, exist_ok=True)
+    # only one layout may be present, otherwise load_matrix could pick up a stale one, and the
+    # manifest of the previous build no longer describes what is being written
+    for name in (
+        MATRIX_FILE,
+        CSR_DATA_FILE,
+        CSR_INDICES_FILE,
+        CSR_INDPTR_FILE,
+        KEYWORD_BITS_FILE,
+        BOOKS_FILE,
+        MANIFEST_FILE,
+        FINGERPRINTS_FILE,
+    ):
+        if os.path.exists(os.path.join(out_dir, name)):
+            os.remove(os.path.join(out_dir, name))
+    # per-emoji scores are derived from the matrix, so the old ones are stale too
+    shutil.rmtree(os.path.join(out_dir, EMOJI_DIR), ignore_errors=True)
+
+
+def save_matrix(out_dir, matrix, keywords, books):
+    """Write a keyword-book matrix artifact.
+    :param out_dir: Directory to write the artifact into (created if missing)
+    :param matrix: 2D array or scipy sparse matrix with one row per keyword and one column per book
+    :param keywords: List of keywords, in row order
+    :param books: BookCatalogue or list of book labels, in column order
+    """
+    _clear_artifact(out_dir)
+
+    if sparse.issparse(matrix):
+        matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        save_array(os.path.join(out_dir, CSR_DATA_FILE), matrix.data)
+        save_array(os.path.join(out_dir, CSR_INDICES_FILE), matrix.indices)
+        save_array(os.path.join(out_dir, CSR_INDPTR_FILE), matrix.indptr)
+    else:
+        save_array(os.path.join(out_dir, MATRIX_FILE), np.ascontiguousarray(matrix, dtype=np.float32))
+    save_array(os.path.join(out_dir, KEYWORD_BITS_FILE), book_keyword_bits(matrix))
+    save_json(os.path.join(out_dir, KEYWORDS_FILE), list(keywords))
+    save_catalogue(out_dir, books)
+
+
+class MatrixWriter:
+    """Write a sparse matrix artifact one column block (a chunk of books) at a time.
+    Each block is spilled to disk as it arrives and the blocks are merged into the CSR arrays
+    by close(), so memory stays bounded by the size of one block rather than the whole matrix.
+    The result is the same artifact save_matrix writes for the stacked blocks."""
+
+    def __init__(self, out_dir, keywords):
+        """
+        :param out_dir: Directory to write the artifact into (created if missing)
+        :param keywords: List of keywords, in row order
+        """
+        _clear_artifact(out_dir)
+        self.out_dir = out_dir
+        self.keywords = list(keywords)
+        self.block_dir = os.path.join(out_dir, BLOCKS_DIR)
+        shutil.rmtree(self.block_dir, ignore_errors=True)
+        os.makedirs(self.block_dir)
+        # per block: number of books and the nonzeros per keyword row
+        self.block_books = []
+        self.block_row_counts = []
+        self.label_offsets = [np.zeros(1, dtype=np.int64)]
+        self._label_bytes = 0
+        self._labels = open(os.path.join(self.block_dir, "labels.bin"), "wb")
+        self._bits = open(os.path.join(self.block_dir, "bits.bin"), "wb")
+
+    @property
+    def n_books(self):
+        return int(sum(self.block_books))
+
+    @property
+    def nnz(self):
+        return int(sum(counts.sum() for counts in self.block_row_counts))
+
+    def append(self, block, books):
+        """Add the next column block.
+        :param block: Sparse matrix with one row per keyword and one column per book of the block
+        :param books: List of the block's book labels, in column order
+        """
+        block = sparse.csr_matrix(block, dtype=np.float32)
+        if block.shape != (len(self.keywords), len(books)):
+            raise ValueError(
+                f"Block shape {block.shape} does not match {len(self.keywords)} keywords x {len(books)} books"
+            )
+        block.sum_duplicates()
+        block.sort_indices()
+
+        b = len(self.block_books)
+        np.save(os.path.join(self.block_dir, f"{b}_data.npy"), block.data)
+        np.save(os.path.join(self.block_dir, f"{b}_indices.npy"), block.indices)
+        self.block_books.append(len(books))
+        self.block_row_counts.append(np.diff(block.indptr).astype(np.int64))
+
+        encoded = [str(book).encode("utf-8") for book in books]
+        self._labels.write(b"".join(encoded))
+        self.label_offsets.append(self._label_bytes + np.cumsum([len(e) for e in encoded], dtype=np.int64))
+        self._label_bytes += sum(len(e) for e in encoded)
+        self._bits.write(book_keyword_bits(block).tobytes())
+
+    def close(self):
+        """Merge the blocks into the final artifact and remove the spilled files."""
+        self._labels.close()
+        self._bits.close()
+        n_books = self.n_books
+        row_counts = np.sum(self.block_row_counts, axis=0) if self.block_row_counts else np.zeros(len(self.keywords))
+        indptr = np.concatenate([[0], np.cumsum(row_counts, dtype=np.int64)])
+        nnz = int(indptr[-1])
+        index_dtype = np.int32 if max(nnz, n_books) < 2**31 else np.int64
+
+        with (
+            new_array(os.path.join(self.out_dir, CSR_DATA_FILE), np.float32, (nnz,)) as data,
+            new_array(os.path.join(self.out_dir, CSR_INDICES_FILE), index_dtype, (nnz,)) as indices,
+        ):
+            # every keyword row gets each block's entries in turn, shifted to the block's first column
+            written = indptr[:-1].copy()
+            first_column = 0
+            for b, counts in enumerate(self.block_row_counts):
+                block_data = np.load(os.path.join(self.block_dir, f"{b}_data.npy"), mmap_mode="r")
+                block_indices = np.load(os.path.join(self.block_dir, f"{b}_indices.npy"), mmap_mode="r")
+                block_indptr = np.concatenate([[0], np.cumsum(counts)])
+                dest = np.repeat(written - block_indptr[:-1], counts) + np.arange(len(block_data))
+                data[dest] = block_data
+                indices[dest] = block_indices + first_column
+                written += counts
+                first_column += self.block_books[b]
+        save_array(os.path.join(self.out_dir, CSR_INDPTR_FILE), indptr.astype(index_dtype))
+
+        label_offsets = np.concatenate(self.label_offsets)
+        copy_raw(
+            os.path.join(self.block_dir, "bits.bin"),
+            os.path.join(self.out_dir, KEYWORD_BITS_FILE),
+            np.uint64,
+            (n_books, n_words(len(self.keywords))),
+        )
+        copy_raw(
+            os.path.join(self.block_dir, "labels.bin"),
+            os.path.join(self.out_dir, CATALOGUE_LABELS_FILE),
+            np.uint8,
+            (int(label_offsets[-1]),),
+        )
+        save_array(os.path.join(self.out_dir, CATALOGUE_OFFSETS_FILE), label_offsets)
+        save_json(os.path.join(self.out_dir, KEYWORDS_FILE), self.keywords)
+
+        shutil.rmtree(self.block_dir)
+
+
+def load_matrix(matrix_dir):
+    """Load a keyword-book matrix artifact.
+    The arrays are memory-mapped read-only, so only the rows that get used are read
+    from disk and several processes can share the same pages.
+    :param matrix_dir: Directory written by save_matrix
+    :return: KeywordBookMatrix
+    """
+    with open(os.path.join(matrix_dir, KEYWORDS_FILE), encoding="utf-8") as f:
+        keywords = json.load(f)
+    if catalogue_exists(matrix_dir):
+        books = load_catalogue(matrix_dir)
+    else:
+        with open(os.path.join(matrix_dir, BOOKS_FILE), encoding="utf-8") as f:
+            books = json.load(f)
+
+    dense_path = os.path.join(matrix_dir, MATRIX_FILE)
+    if os.path.exists(dense_path):
+        matrix = np.load(dense_path, mmap_mode="r")
+    else:
+        data = np.load(os.path.join(matrix_dir, CSR_DATA_FILE), mmap_mode="r")
+        indices = np.load(os.path.join(matrix_dir, CSR_INDICES_FILE), mmap_mode="r")
+        indptr = np.load(os.path.join(matrix_dir, CSR_INDPTR_FILE), mmap_mode="r")
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(keywords), len(books)), copy=False)
+
+    # artifacts from before the bitsets were stored get them computed on load
+    bits_path = os.path.join(matrix_dir, KEYWORD_BITS_FILE)
+    keyword_bits = np.load(bits_path, mmap_mode="r") if os.path.exists(bits_path) else None
+
+    return KeywordBookMatrix(matrix, keywords, books, keyword_bits)
+
+
+def save_manifest(out_dir, manifest, fingerprints):
+    """Record how an artifact was built, so the next build can tell what changed.
+    :param out_dir: Artifact directory
+    :param manifest: Dict of build information (keyword hash, options, sizes)
+    :param fingerprints: uint64 array with one fingerprint per book, in column order
+    """
+    save_array(os.path.join(out_dir, FINGERPRINTS_FILE), np.asarray(fingerprints, dtype=np.uint64))
+    save_json(os.path.join(out_dir, MANIFEST_FILE), manifest, indent=2)
+
+
+def load_manifest(matrix_dir):
+    """Read the build manifest of an artifact.
+    :param matrix_dir: Artifact directory
+    :return: Tuple of (manifest dict, book fingerprints), or (None, None) if the artifact has no manifest
+    """
+    manifest_path = os.path.join(matrix_dir, MANIFEST_FILE)
+    fingerprints_path = os.path.join(matrix_dir, FINGERPRINTS_FILE)
+    if not (os.path.exists(manifest_path) and os.path.exists(fingerprints_path)):
+        return None, None
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest, np.load(fingerprints_path)
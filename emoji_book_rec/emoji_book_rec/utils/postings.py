@@ -0,0 +1,241 @@
+"""Compressed posting lists for the keyword index.
+Every keyword keeps the sorted integer ids of the books it was found in, stored as varint-encoded
+gaps, next to the term frequency score of each of those books. A query only decodes and merges the
+postings of its own keywords, so its cost grows with the number of matching books rather than
+the size of the catalogue."""
+
+import json
+import os
+
+import numpy as np
+
+from .atomic import replacing_dir, save_array, save_json
+from .catalogue import BookCatalogue, load_catalogue, save_catalogue
+from .spill import SpillFile
+
+KEYWORDS_FILE = "keywords.json"
+IDS_FILE = "ids.npy"
+ID_OFFSETS_FILE = "id_offsets.npy"
+SCORES_FILE = "scores.npy"
+INDPTR_FILE = "indptr.npy"
+
+
+def encode_varints(values):
+    """Encode non-negative integers as LEB128 varints (7 bits per byte, high bit set on all but the last).
+    :param values: 1D array of non-negative integers
+    :return: 1D uint8 array
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    bit_lengths = np.zeros(len(values), dtype=np.int64)
+    remaining = values.copy()
+    while remaining.any():
+        bit_lengths += remaining > 0
+        remaining >>= np.uint64(7)
+    n_bytes = np.maximum(bit_lengths, 1)
+
+    starts = np.cumsum(n_bytes) - n_bytes
+    out = np.zeros(int(n_bytes.sum()), dtype=np.uint8)
+    for b in range(int(n_bytes.max(initial=0))):
+        has_byte = n_bytes > b
+        byte = (values[has_byte] >> np.uint64(7 * b)) & np.uint64(0x7F)
+        more = np.where(n_bytes[has_byte] > b + 1, 0x80, 0).astype(np.uint64)
+        out[starts[has_byte] + b] = byte | more
+    return out
+
+
+def decode_varints(buf):
+    """Decode a buffer written by encode_varints.
+    :param buf: 1D uint8 array
+    :return: 1D int64 array
+    """
+    buf = np.asarray(buf, dtype=np.uint8)
+    if not len(buf):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    position = np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)
+    parts = (buf & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+class PostingIndex:
+    """Keyword -> (sorted book ids, scores) posting lists, with the ids delta and varint encoded."""
+
+    def __init__(self, keywords, books, ids, id_offsets, scores, indptr):
+        """
+        :param keywords: List of keywords, one posting list each
+        :param books: BookCatalogue or list of book labels, indexed by book id
+        :param ids: uint8 array of every posting list's varint-encoded id gaps, one list after the other
+        :param id_offsets: Byte offset of each keyword's ids in ids (one more entry than keywords)
+        :param scores: float32 term frequency scores of all postings, one list after the other
+        :param indptr: Offset of each keyword's postings in scores (one more entry than keywords)
+        """
+        self.keywords = list(keywords)
+        self.books = BookCatalogue.from_labels(books)
+        self.keyword_index = {kw: i for i, kw in enumerate(self.keywords)}
+        self.ids = ids
+        self.id_offsets = id_offsets
+        self.scores = scores
+        self.indptr = indptr
+
+    def __contains__(self, keyword):
+        return keyword in self.keyword_index
+
+    def postings(self, keyword):
+        """Decode the posting list of one keyword.
+        :param keyword: Keyword to look up
+        :return: Tuple of (sorted book ids, scores)
+        """
+        i = self.keyword_index[keyword]
+        gaps = decode_varints(self.ids[self.id_offsets[i] : self.id_offsets[i + 1]])
+        return np.cumsum(gaps), self.scores[self.indptr[i] : self.indptr[i + 1]]
+
+    def score(self, keyword_counts):
+        """Merge the posting lists of the query keywords into scores for the books they contain.
+        Each book's score adds up its keywords in keyword_counts order, like QueryEngine.score.
+        :param keyword_counts: Counter of query keywords
+        :return: Tuple of (sorted ids of the matched books, their scores, distinct keywords found in each,
+            position in keyword_counts of the first keyword found in each, like QueryEngine.first_match)
+        """
+        ids, weights, positions = [], [], []
+        for i, (kw, count) in enumerate(keyword_counts.items()):
+            if kw in self:
+                book_ids, scores = self.postings(kw)
+                ids.append(book_ids)
+                weights.append(scores.astype(np.float64) * count)
+                positions.append(i)
+        if not ids:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, np.zeros(0), empty, empty
+
+        matched, first_index, inverse = np.unique(np.concatenate(ids), return_index=True, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.concatenate(weights), minlength=len(matched))
+        distinct = np.bincount(inverse, minlength=len(matched))
+        # the lists are concatenated in keyword_counts order, so a book's first entry is its first keyword's
+        starts = np.cumsum([0] + [len(book_ids) for book_ids in ids[:-1]])
+        first = np.array(positions)[np.searchsorted(starts, first_index, side="right") - 1]
+        return matched, sums + 1.5 * distinct, distinct, first
+
+    def keywords_found(self, keyword_counts, book):
+        """Which query keywords have book in their posting list.
+        :param keyword_counts: Counter of query keywords
+        :param book: Book id
+        :return: Set of keywords
+        """
+        found = set()
+        for kw in keyword_counts:
+            if kw in self:
+                book_ids, _ = self.postings(kw)
+                i = np.searchsorted(book_ids, book)
+                if i < len(book_ids) and book_ids[i] == book:
+                    found.add(kw)
+        return found
+
+    @classmethod
+    def from_lists(cls, keywords, books, lists):
+        """Build the index from uncompressed posting lists.
+        :param keywords: List of keywords
+        :param books: List of book labels, indexed by book id
+        :param lists: List with one (book ids, scores) pair per keyword
+        :return: PostingIndex
+        """
+        encoded, scores, lengths = [], [], []
+        for book_ids, values in lists:
+            list_ids, list_scores = _encode_list(book_ids, values)
+            encoded.append(list_ids)
+            scores.append(list_scores)
+            lengths.append(len(list_scores))
+
+        id_offsets = np.concatenate([[0], np.cumsum([len(e) for e in encoded], dtype=np.int64)])
+        indptr = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        return cls(
+            keywords,
+            books,
+            np.concatenate(encoded) if encoded else np.zeros(0, dtype=np.uint8),
+            id_offsets,
+            np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+            indptr,
+        )
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Build the index from the rows of a keyword-book matrix (each row already is a posting list).
+        :param matrix: KeywordBookMatrix
+        :return: PostingIndex
+        """
+        return cls.from_lists(matrix.keywords, matrix.books, _matrix_lists(matrix))
+
+
+def _encode_list(book_ids, values):
+    """Sort one posting list by book id and varint-encode the id gaps.
+    :return: Tuple of (uint8 encoded ids, float32 scores in id order)
+    """
+    order = np.argsort(book_ids, kind="stable")
+    book_ids = np.asarray(book_ids, dtype=np.int64)[order]
+    return encode_varints(np.diff(book_ids, prepend=0)), np.asarray(values, dtype=np.float32)[order]
+
+
+def _matrix_lists(matrix):
+    """Yield the (book ids, scores) posting list of each keyword row of a matrix, without zeros."""
+    for kw in matrix.keywords:
+        book_ids, values = matrix.row_entries(kw)
+        nonzero = values != 0
+        yield book_ids[nonzero], values[nonzero]
+
+
+def save_postings(out_dir, index):
+    """Write a posting index artifact.
+    :param out_dir: Directory to write into (created if missing)
+    :param index: PostingIndex
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    save_array(os.path.join(out_dir, IDS_FILE), index.ids)
+    save_array(os.path.join(out_dir, ID_OFFSETS_FILE), index.id_offsets)
+    save_array(os.path.join(out_dir, SCORES_FILE), index.scores)
+    save_array(os.path.join(out_dir, INDPTR_FILE), index.indptr)
+    save_json(os.path.join(out_dir, KEYWORDS_FILE), index.keywords)
+    save_catalogue(out_dir, index.books)
+
+
+def write_postings(out_dir, matrix):
+    """Build the posting index of a keyword-book matrix and write it one keyword row at a time.
+    Writes the same artifact as save_postings(out_dir, PostingIndex.from_matrix(matrix)), but only one
+    posting list is held in memory at a time instead of a copy of the whole matrix. The index is built
+    in a new directory that replaces out_dir at the end, so engines never load a mix of old and new files.
+    :param out_dir: Directory to write (replaced if it exists)
+    :param matrix: KeywordBookMatrix, e.g. memory-mapped by load_matrix
+    """
+    with replacing_dir(out_dir) as build_dir:
+        ids = SpillFile(os.path.join(build_dir, IDS_FILE), np.uint8)
+        scores = SpillFile(os.path.join(build_dir, SCORES_FILE), np.float32)
+        id_offsets, indptr = [0], [0]
+        for book_ids, values in _matrix_lists(matrix):
+            list_ids, list_scores = _encode_list(book_ids, values)
+            ids.write(list_ids)
+            scores.write(list_scores)
+            id_offsets.append(ids.length)
+            indptr.append(scores.length)
+        ids.close()
+        scores.close()
+        save_array(os.path.join(build_dir, ID_OFFSETS_FILE), np.array(id_offsets, dtype=np.int64))
+        save_array(os.path.join(build_dir, INDPTR_FILE), np.array(indptr, dtype=np.int64))
+        save_json(os.path.join(build_dir, KEYWORDS_FILE), matrix.keywords)
+        # the labels are written straight from the matrix's (memory-mapped) catalogue
+        save_catalogue(build_dir, matrix.books)
+
+
+def load_postings(postings_dir):
+    """Load (memory-mapped) a posting index artifact.
+    :param postings_dir: Directory written by save_postings
+    :return: PostingIndex
+    """
+    with open(os.path.join(postings_dir, KEYWORDS_FILE), encoding="utf-8") as f:
+        keywords = json.load(f)
+    return PostingIndex(
+        keywords,
+        load_catalogue(postings_dir),
+        np.load(os.path.join(postings_dir, IDS_FILE), mmap_mode="r"),
+        np.load(os.path.join(postings_dir, ID_OFFSETS_FILE)),
+        np.load(os.path.join(postings_dir, SCORES_FILE), mmap_mode="r"),
+        np.load(os.path.join(postings_dir, INDPTR_FILE)),
+    )
@@ -3,113 +3,521 @@
     based on the keywords associated with the emojis."""
 
 from collections import Counter
-import pandas as pd
+from itertools import islice
+import os
+import numpy as np
+from scipy import sparse
 import logging
-from datetime import datetime
+import time
 
 from .keyword_tsv_to_dict import generate_keyword_dict
-from .index import create_index
-
-def process_query(query, filepath, use_precomputed=True, matrix_path=None):
+from .bitsets import popcount
+from .audit_log import audit, audit_enabled
+from .emoji_index import keyword_dict_hash, load_emoji_index
+from .instrumentation import METRICS
+from .matrix_store import load_matrix
+from .postings import load_postings
+from .query_cache import QueryCache, query_key
+
+# books per query written to the audit log
+AUDIT_RESULTS = 25
+# seconds between checks of an engine's files for changes, so cached queries do not stat them every time
+VERSION_CHECK_INTERVAL = 1.0
+
+
+class QueryEngine:
+    """Keeps the emoji keyword dictionary and the keyword-book matrix loaded in memory,
+    so many queries can be served without re-reading either file."""
+
+    def __init__(self, filepath, matrix_path, cache_size=1024, cache_ttl=None):
+        """
+        :param filepath: File path for emoji keyword list
+        :param matrix_path: Path to the precomputed keyword-book matrix artifact directory
+        :param cache_size: Number of query results kept in the result cache (0 turns it off)
+        :param cache_ttl: Seconds a cached result stays valid, or None for no expiry
+        """
+        self.filepath = filepath
+        self.matrix_path = matrix_path
+        # taken before loading, so a file replaced during the load shows up as a change later
+        self.version = artifact_version(filepath, matrix_path)
+        self.checked = time.monotonic()
+        # results belong to this engine, so reloading after a file change starts with an empty cache
+        self.cache = QueryCache(maxsize=cache_size, ttl=cache_ttl)
+
+        # emoji_kw_dict: Dictionary of emojis and associated keywords
+        with METRICS.span("keyword_dict_load"):
+            self.emoji_kw_dict = generate_keyword_dict(filepath)
+        with METRICS.span("matrix_load"):
+            self.load(matrix_path)
+
+    def load(self, matrix_path):
+        """Load the scoring artifact (subclasses load a different one)."""
+        # the matrix is memory-mapped (sparse CSR or dense), so only the rows of queried keywords are read
+        self.matrix = load_matrix(matrix_path)
+
+        # per-emoji score rows, only usable if built from this keyword list and this matrix
+        emoji_index = load_emoji_index(matrix_path, self.matrix)
+        if emoji_index is not None and emoji_index.keywords_hash != keyword_dict_hash(self.emoji_kw_dict):
+            emoji_index = None
+        self.emoji_index = emoji_index
+
+    def is_current(self):
+        """Whether the files the engine was loaded from are unchanged on disk.
+        They are only looked at again once VERSION_CHECK_INTERVAL seconds have passed since the last
+        check that found them unchanged; once a change is seen, the engine stays out of date.
+        :return: bool
+        """
+        now = time.monotonic()
+        if now - self.checked < VERSION_CHECK_INTERVAL:
+            return True
+        if artifact_version(self.filepath, self.matrix_path) != self.version:
+            return False
+        self.checked = now
+        return True
+
+    def keyword_counts(self, query):
+        """Collect the keywords for every emoji in the query.
+        :param query: List of emoji short texts
+        :return: Tuple of (flat list of query keywords, Counter of those keywords)
+        """
+        query_keywords = []
+
+        for emoji in self.emoji_kw_dict:
+
+            if emoji in query:
+                query_keywords.extend(self.emoji_kw_dict[emoji])  # flatten list
+
+        return query_keywords, Counter(query_keywords)
+
+    def score(self, keyword_counts):
+        """Score every book against a set of weighted keywords in one pass over the matrix.
+        The weighted term frequencies are a single mat-vec of the query keywords' rows against
+        their counts, and the diversity bonus is the popcount of each matched book's keyword bits
+        masked by the query keywords.
+        :param keyword_counts: Counter of query keywords
+        :return: Tuple of (scores, number of distinct keywords found), both arrays with one entry per book
+        """
+        matrix = self.matrix
+        # rows stay in keyword_counts order, so every book's score is summed in the same order as before
+        query_kws = [kw for kw in keyword_counts if kw in matrix]
+        rows = [matrix.keyword_index[kw] for kw in query_kws]
+        weights = np.array([keyword_counts[kw] for kw in query_kws], dtype=np.float64)
+        n_books = len(matrix.books)
+
+        if not rows:
+            return np.zeros(n_books), np.zeros(n_books, dtype=np.int64)
+
+        with METRICS.span("scoring"):
+            sub = matrix.matrix[rows]
+            if matrix.is_sparse:
+                # the transpose of a CSR slice is CSC, whose mat-vec accumulates one keyword row at a time
+                scores = sub.T @ weights
+                candidates = np.unique(sub.indices[sub.data > 0])
+            else:
+                sub = np.asarray(sub)
+                scores = (sub * weights[:, None]).sum(axis=0)
+                candidates = np.flatnonzero((sub > 0).any(axis=0))
+
+        with METRICS.span("bonus"):
+            distinct = np.zeros(n_books, dtype=np.int64)
+            distinct[candidates] = popcount(matrix.keyword_bits[candidates] & matrix.keyword_mask(query_kws))
+            scores = scores + 1.5 * distinct
+        return scores, distinct
+
+    def keywords_found(self, keyword_counts, book):
+        """Reconstruct which query keywords were found in one book's description.
+        :param keyword_counts: Counter of query keywords
+        :param book: Column index of the book
+        :return: Set of keywords with a nonzero score for the book
+        """
+        return set(self.matrix.keywords_found(book, self.matrix.keyword_mask(keyword_counts)))
+
+    def query(self, query, top_k=5, return_all=False, use_cache=True):
+        """Score every book in the matrix against an emoji query and rank the best ones.
+        :param query: List of emoji short texts
+        :param top_k: Number of books to return
+        :param return_all: If True, ignore top_k and return every matched book (for analysis)
+        :param use_cache: If True, answer repeated queries from the result cache
+        :return: List of (book title, score) sorted by score, highest first
+        """
+        start = time.perf_counter()
+        # with the audit log on, the AUDIT_RESULTS books it records are ranked in the same pass
+        depth = max(top_k, AUDIT_RESULTS) if audit_enabled() and not return_all else top_k
+
+        # the same emojis in any order give the same ranking, so they share one cache entry
+        key = query_key(query, None if return_all else top_k, return_all)
+        METRICS.inc("queries")
+        if use_cache:
+            found, ranking = self.cache.get(key)
+            if found:
+                METRICS.inc("cache_hits")
+                audit_query(query, None if return_all else top_k, ranking, start, cached=True)
+                return list(ranking if return_all else ranking[:top_k])
+            METRICS.inc("cache_misses")
+
+        with METRICS.span("query"):
+            ranking = self._rank(query, depth, return_all)
+        if use_cache:
+            self.cache.put(key, tuple(ranking))
+        audit_query(query, None if return_all else top_k, ranking, start, cached=False)
+        return ranking if return_all else ranking[:top_k]
+
+    def _rank(self, query, top_k, return_all):
+        """Score and rank one query, logging the top 25 at debug level (the uncached part of query)."""
+        with METRICS.span("keyword_lookup"):
+            query_keywords, keyword_counts = self.keyword_counts(query)
+
+        # the top 25 are only selected, decoded and formatted when debug logging is on
+        log_top = logging.getLogger().isEnabledFor(logging.DEBUG)
+        logging.debug('"Query keywords: %s"', query_keywords)
+        logging.debug('"Keyword counts: %s"', keyword_counts)
+
+        matched, scores, first_match = self.match(query, keyword_counts)
+        candidates = np.arange(len(matched))
+        with METRICS.span("top_k"):
+            if return_all:
+                ranked = top_k_indices(scores, candidates, len(matched), first_match)
+            else:
+                # select enough for both the results and the log in one pass
+                ranked = top_k_indices(scores, candidates, max(top_k, 25) if log_top else top_k, first_match)
+
+        if log_top:
+            logging.debug('"Top 25 Search Results"')
+            #print top 25 books
+            for i, r in enumerate(ranked[:25]):
+                logging.debug(
+                    f'"Rank: {i+1}, Title: {self.books[matched[r]]}, Score: {scores[r]}, '
+                    f'Keywords found: {self.keywords_found(keyword_counts, matched[r])}"'
+                )
+
+        with METRICS.span("render"):
+            if not return_all:
+                ranked = ranked[:top_k]
+            return [(self.books[matched[r]], float(scores[r])) for r in ranked]
+
+    def match(self, query, keyword_counts):
+        """Find and score the books matching at least one query keyword (only those are ranked).
+        :param query: List of emoji short texts
+        :param keyword_counts: Counter of query keywords
+        :return: Tuple of (sorted book ids, their scores, function giving the first_match of
+            positions in them, to break ties with)
+        """
+        if self.emoji_index is not None:
+            # a sum of at most 5 precomputed emoji rows instead of up to 25 keyword rows
+            scores, distinct = self.emoji_index.score(query)
+        else:
+            scores, distinct = self.score(keyword_counts)
+        matched = np.flatnonzero(distinct)
+        return matched, scores[matched], lambda r: self.first_match(keyword_counts, matched[r])
+
+    def first_match(self, keyword_counts, books):
+        """Position in keyword_counts of the first query keyword found in each of some books.
+        Books with equal scores are ranked by it, then by book id: the order in which a loop over
+        the query keywords, and over each keyword's books, first comes across them.
+        :param keyword_counts: Counter of query keywords
+        :param books: Array of book ids
+        :return: int array, one entry per book
+        """
+        matrix = self.matrix
+        bits = matrix.keyword_bits[books]
+        first = np.full(len(books), len(keyword_counts), dtype=np.int64)
+        # the earliest keyword is applied last, so it is the one that sticks
+        for i, kw in reversed(list(enumerate(keyword_counts))):
+            if kw in matrix:
+                row = matrix.keyword_index[kw]
+                found = (bits[:, row >> 6] >> np.uint64(row & 63)) & np.uint64(1)
+                first[found.astype(bool)] = i
+        return first
+
+    @property
+    def books(self):
+        return self.matrix.books
+
+    def query_batch(self, queries, top_k=5):
+        """Score many emoji queries at once and rank the best books for each.
+        The queries become one sparse query x keyword weight matrix, so all scores come out of
+        one sparse matrix product instead of one pass per query, and the diversity bonuses of
+        each query's matched books from a popcount of their keyword bits.
+        Scores are identical to calling query on each query separately.
+        :param queries: List of queries, each a list of emoji short texts
+        :param top_k: Number of books to return per query
+        :return: List with one ranked list of (book title, score) per query
+        """
+        matrix = self.matrix
+        METRICS.inc("batches")
+        METRICS.inc("batch_queries", len(queries))
+        if self.emoji_index is not None:
+            with METRICS.span("batch_scoring"):
+                totals = self.emoji_index.score_batch(queries)
+            with METRICS.span("batch_rank"):
+                return [self._rank_row(totals, i, top_k, self.keyword_counts(q)[1]) for i, q in enumerate(queries)]
+
+        with METRICS.span("keyword_lookup"):
+            all_counts = [self.keyword_counts(q)[1] for q in queries]
+
+        if not matrix.is_sparse:
+            results = []
+            for keyword_counts in all_counts:
+                scores, distinct = self.score(keyword_counts)
+                ranked = top_k_indices(
+                    scores, np.flatnonzero(distinct), top_k, lambda books: self.first_match(keyword_counts, books)
+                )
+                results.append([(matrix.books[j], float(scores[j])) for j in ranked])
+            return results
+
+        # only the keyword rows some query uses are pulled out of the matrix
+        used_rows = sorted({matrix.keyword_index[kw] for kc in all_counts for kw in kc if kw in matrix})
+        local = {row: i for i, row in enumerate(used_rows)}
+
+        # each query's keywords stay in keyword_counts order inside its row, which is the order the
+        # product sums them in, so every score matches the single query path exactly
+        data, indices, indptr = [], [], [0]
+        for keyword_counts in all_counts:
+            for kw, count in keyword_counts.items():
+                if kw in matrix:
+                    indices.append(local[matrix.keyword_index[kw]])
+                    data.append(count)
+            indptr.append(len(indices))
+        weights = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(queries), len(used_rows)),
+        )
+        with METRICS.span("batch_scoring"):
+            sub = sparse.csr_matrix(matrix.matrix[used_rows], dtype=np.float64)
+            sub.eliminate_zeros()
+            totals = sparse.csr_matrix(weights @ sub)
+            totals.sort_indices()
+
+        # the diversity bonus of each query's matched books comes from their keyword bits
+        with METRICS.span("batch_bonus"):
+            for i, keyword_counts in enumerate(all_counts):
+                start, end = totals.indptr[i], totals.indptr[i + 1]
+                distinct = popcount(
+                    matrix.keyword_bits[totals.indices[start:end]] & matrix.keyword_mask(keyword_counts)
+                )
+                totals.data[start:end] += 1.5 * distinct
+        with METRICS.span("batch_rank"):
+            return [self._rank_row(totals, i, top_k, kc) for i, kc in enumerate(all_counts)]
+
+    def _rank_row(self, totals, i, top_k, keyword_counts):
+        """Rank the matched books of one row of a query x book CSR matrix of total scores."""
+        start, end = totals.indptr[i], totals.indptr[i + 1]
+        cols, values = totals.indices[start:end], totals.data[start:end]
+        ranked = top_k_indices(
+            values, np.arange(len(cols)), top_k, lambda r: self.first_match(keyword_counts, cols[r])
+        )
+        return [(self.matrix.books[cols[r]], float(values[r])) for r in ranked]
+
+    def query_stream(self, queries, top_k=5, batch_size=1024):
+        """Score any number of queries in batches, yielding results as each batch is done.
+        Only one batch of queries and results is held in memory at a time.
+        :param queries: Iterable of queries, each a list of emoji short texts
+        :param top_k: Number of books to return per query
+        :param batch_size: Number of queries scored per matrix product
+        :return: Generator of (query, ranked list of (book title, score)), in input order
+        """
+        queries = iter(queries)
+        while True:
+            batch = list(islice(queries, batch_size))
+            if not batch:
+                return
+            yield from zip(batch, self.query_batch(batch, top_k))
+
+
+class PostingQueryEngine(QueryEngine):
+    """QueryEngine over the compressed posting lists instead of the keyword-book matrix.
+    A query decodes and merges only its keywords' postings, so its cost grows with the number
+    of matching books rather than the size of the catalogue. Scores are the same as the matrix's."""
+
+    def load(self, postings_path):
+        # postings: keyword -> sorted book ids and scores, memory-mapped
+        self.postings = load_postings(postings_path)
+        self.emoji_index = None
+
+    @property
+    def books(self):
+        return self.postings.books
+
+    def match(self, query, keyword_counts):
+        # merging the postings adds up the scores and the bonus together
+        with METRICS.span("scoring"):
+            matched, scores, _, first = self.postings.score(keyword_counts)
+        return matched, scores, lambda r: first[r]
+
+    def keywords_found(self, keyword_counts, book):
+        return self.postings.keywords_found(keyword_counts, book)
+
+    def query_batch(self, queries, top_k=5):
+        """Score many emoji queries, merging each one's postings separately.
+        :param queries: List of queries, each a list of emoji short texts
+        :param top_k: Number of books to return per query
+        :return: List with one ranked list of (book title, score) per query
+        """
+        METRICS.inc("batches")
+        METRICS.inc("batch_queries", len(queries))
+        results = []
+        for query in queries:
+            matched, scores, first_match = self.match(query, self.keyword_counts(query)[1])
+            ranked = top_k_indices(scores, np.arange(len(matched)), top_k, first_match)
+            results.append([(self.books[matched[r]], float(scores[r])) for r in ranked])
+        return results
+
+
+def audit_query(query, top_k, ranking, start, cached):
+    """Put a query and its top AUDIT_RESULTS books on the audit log (if one is running).
+    :param query: List of emoji short texts
+    :param top_k: Number of books asked for, or None for every matched book
+    :param ranking: List of (book title, score), best first; ranked at least AUDIT_RESULTS deep when
+        there are that many, even if fewer were asked for
+    :param start: time.perf_counter() when the query came in
+    :param cached: Whether the ranking came from the result cache
+    """
+    if not audit_enabled():
+        return
+    audit(
+        "query",
+        query=list(query),
+        top_k=top_k,
+        cached=cached,
+        duration_ms=(time.perf_counter() - start) * 1000,
+        n_results=len(ranking) if top_k is None else min(top_k, len(ranking)),
+        results=[[title, score] for title, score in ranking[:AUDIT_RESULTS]],
+    )
+
+
+def top_k_indices(scores, candidates, k, first_match=None):
+    """Pick the k highest scoring candidates without sorting all of them.
+    Partial selection (np.partition) finds the k-th best score in linear time, then only the
+    selected k are sorted. Ties are ranked by first_match and then keep the candidates' order, as a
+    full stable sort of the books in the order the query's keywords first matched them would.
+    :param scores: Array of scores, one per book
+    :param candidates: Sorted array of the book indices to choose from
+    :param k: Number of books to return
+    :param first_match: Function giving the tie order of an array of candidates (e.g. from
+        QueryEngine.match), only called for the selected ones and those tied with the k-th;
+        None breaks ties by candidate order alone
+    :return: Array of at most k book indices, best first
+    """
+    if k <= 0:
+        return candidates[:0]
+    values = scores[candidates]
+    if k < len(candidates):
+        kth = -np.partition(-values, k - 1)[k - 1]
+        keep = values > kth
+        ties = np.flatnonzero(values == kth)
+        if first_match is not None:
+            ties = ties[np.argsort(first_match(candidates[ties]), kind="stable")]
+        keep[ties[: k - np.count_nonzero(keep)]] = True
+        candidates, values = candidates[keep], values[keep]
+    if first_match is None:
+        return candidates[np.argsort(-values, kind="stable")]
+    return candidates[np.lexsort((first_match(candidates), -values))]
+
+
+def artifact_version(filepath, matrix_path):
+    """Identify the current state of the keyword list and matrix artifact on disk.
+    :param filepath: File path for emoji keyword list
+    :param matrix_path: Path to the matrix artifact directory
+    :return: Tuple of (name, modification time, size) for every file involved
+    """
+    paths = [filepath]
+    for root, dirs, files in os.walk(matrix_path):
+        dirs.sort()
+        paths += [os.path.join(root, name) for name in sorted(files)]
+    version = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        version.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+# shared engines, one per (keyword file, matrix path)
+_engines = {}
+
+
+def clear_engines():
+    """Drop every shared engine, so the next get_engine call loads its files again."""
+    _engines.clear()
+
+
+def get_engine(filepath, matrix_path, engine_class=QueryEngine):
+    """Return a shared QueryEngine for the given files, loading it on first use.
+    The engine (and with it the result cache) is reloaded when either file changed on disk,
+    which is checked at most every VERSION_CHECK_INTERVAL seconds. If the reload fails (e.g. the
+    artifact is being swapped out by a build), the loaded engine keeps answering and the reload is
+    tried again at the next check.
+    :param filepath: File path for emoji keyword list
+    :param matrix_path: Path to the precomputed keyword-book matrix artifact directory
+        (or the posting index directory for PostingQueryEngine)
+    :param engine_class: QueryEngine or PostingQueryEngine
+    :return: QueryEngine
+    """
+    key = (engine_class, filepath, matrix_path)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = _engines[key] = engine_class(filepath, matrix_path)
+    elif not engine.is_current():
+        try:
+            engine = _engines[key] = engine_class(filepath, matrix_path)
+        except Exception:
+            logging.warning("Could not reload %s, still using the loaded version", matrix_path, exc_info=True)
+            engine.checked = time.monotonic()
+    return engine
+
+
+def process_query(query, filepath, use_precomputed=True, matrix_path=None, top_k=None, postings_path=None):
     """
 
 	:param query: List of emoji queries from user in Unicode
 
 	:param filepath: File path for emoji keyword list
 
-	:param use_precomputed: If True, use a precomputed keyword-book matrix
-
-    :param matrix_path: Required if use_precomputed=True; path to the TSV matrix
-
-	:return: Sorted dictionary of book titles
-
-	"""
-
-    #start logging
-    output_file = 'emoji_book_rec/logs.txt'
-    logging.basicConfig(filename='logs.txt', level=logging.INFO)
-    logging.info(f'"{datetime.now()}: Query submitted. ************************************"')
-    logging.info(f'"Generating keyword dictionary from {filepath}"')
-    logging.info(f'"Writing to {output_file}"')
-
-    # emoji_kw_dict: Dictionary of emojis and associated keywords
-    emoji_kw_dict = generate_keyword_dict(filepath)
+	:param use_precomputed: If True, use a precomputed keyword-book matrix, otherwise the posting index
 
-    # book index
-    #kw_book_index = create_index(books, emoji_kw_dict)  # build index
+    :param matrix_path: Required if use_precomputed=True; path to the matrix artifact directory
 
-    query_keywords = []
+    :param top_k: If given, only the top_k books are returned; otherwise every matched book is
 
-    for emoji in emoji_kw_dict:
+    :param postings_path: Required if use_precomputed=False; path to the posting index directory
 
-        if emoji in query:
-            query_keywords.extend(emoji_kw_dict[emoji])  # flatten list
+	:return: Sorted list of (book title, score)
 
-    keyword_counts = Counter(query_keywords)
-
-    # ----------------New logic----------------
-    logging.info(f'"Query keywords: {query_keywords}"')
-    logging.info(f'"Keyword counts: {keyword_counts}"')
+	"""
 
     if use_precomputed:
 
         if not matrix_path:
             raise ValueError("Matrix path required when use_precomputed=True")
 
-        matrix_df = pd.read_csv(matrix_path, sep='\t', index_col=0)
-
-        book_scores = {}
-        book_keyword_sets = {}
-
-        for kw, count in keyword_counts.items():
-            if kw in matrix_df.index:
-                for book_title, freq in matrix_df.loc[kw].items():
-                    if freq > 0:
-                        #count number of different keywords (got help from ChatGPT on how to design this part of the function)
-                        if book_title not in book_keyword_sets:
-                            book_keyword_sets[book_title] = set()
-                        if kw not in book_keyword_sets:
-                            book_keyword_sets[book_title].add(kw)
-
-                        book_scores[book_title] = book_scores.get(book_title, 0) + freq * count
-
-        book_different_keywords = {title: len(kw_set) for title, kw_set in book_keyword_sets.items()}
-
-        for title in book_scores:
-            book_scores[title] = book_scores[title] + (1.5*book_different_keywords[title])
+        # the engine is loaded once per (filepath, matrix_path) and reused by later queries
+        return get_engine(filepath, matrix_path).query(query, top_k=top_k or 0, return_all=top_k is None)
 
-        logging.info(f'"Top 25 Search Results"')
-        #print top 25 books
-        for i, (key, value) in enumerate(sorted(book_scores.items(), key=lambda x: x[1], reverse=True)):
-            if i >= 25:
-                break
-            logging.info(f'"Rank: {i+1}, Title: {key}, Score: {value}, Keywords found: {book_keyword_sets[key]}"')
+    if not postings_path:
+        raise ValueError("Postings path required when use_precomputed=False")
 
-        #If uncommented: gives top 25 just on diversity of keywords
-        #for i, (key, value) in enumerate(sorted(book_different_keywords.items(), key=lambda x: x[1], reverse=True)):
-        #    if i >= 25:
-        #        break
-        #    print(f"Key: {key}, Value: {value}")
+    # only the postings of the query keywords are decoded and merged
+    engine = get_engine(filepath, postings_path, PostingQueryEngine)
+    return engine.query(query, top_k=top_k or 0, return_all=top_k is None)
 
-        logging.info(f'"SEARCH COMPLETED ************************************"')
-        return sorted(book_scores.items(), key=lambda x: x[1], reverse=True)
 
+def process_queries(queries, filepath, matrix_path, top_k=5, batch_size=1024):
+    """
+    Score many emoji queries, e.g. for offline evaluation or cache warm-up.
 
-    # ----------------End of new logic----------------
-
-    # Prioritize keywords appearing multiple times
-
-    book_scores = {}
-
-    for keyword, count in keyword_counts.items():
+    :param queries: Iterable of queries, each a list of emoji short texts; may be a generator
 
-        for book_title, tf_count in kw_book_index.get(keyword, []):
+    :param filepath: File path for emoji keyword list
 
-            if book_title in book_scores:
+    :param matrix_path: Path to the matrix artifact directory
 
-                book_scores[book_title] += tf_count * count
+    :param top_k: Number of books to return per query
 
-            else:
+    :param batch_size: Number of queries scored together in one matrix product
 
-                book_scores[book_title] = tf_count * count
+    :return: Generator of (query, sorted list of (book title, score)), yielded batch by batch
 
+    """
+    return get_engine(filepath, matrix_path).query_stream(queries, top_k=top_k, batch_size=batch_size)
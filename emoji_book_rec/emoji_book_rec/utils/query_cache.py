@@ -0,0 +1,92 @@
+"""LRU cache (with optional TTL) for query results.
+There are only 108 emojis and queries hold at most 5, so the same queries come back over and over;
+their rankings are kept here, keyed by the order-insensitive multiset of emoji short texts."""
+
+from collections import Counter, OrderedDict
+import threading
+import time
+
+
+def query_key(query, *options):
+    """Canonical cache key for a query: the multiset of its emojis plus any ranking options.
+    :param query: List of emoji short texts
+    :param options: Extra values that change the result (e.g. top_k)
+    :return: Hashable key
+    """
+    return tuple(sorted(Counter(query).items())), options
+
+
+class QueryCache:
+    """Least recently used cache of query results, with an optional time to live."""
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        """
+        :param maxsize: Most results kept; the least recently used one is dropped beyond that
+        :param ttl: Seconds a result stays valid, or None to keep it until it is evicted
+        :param clock: Function returning the current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        # the GUI worker thread, the service executor and callers of process_query may share a cache
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Look up a result.
+        :param key: Key from query_key
+        :return: Tuple of (found, result)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is not None and self.clock() - stored_at > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """Store a result, evicting the least recently used one if the cache is full.
+        :param key: Key from query_key
+        :param value: Result to store
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters.
+        :return: Dict of counters and the current size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
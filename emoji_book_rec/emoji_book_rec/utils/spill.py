@@ -0,0 +1,62 @@
+"""Write large arrays to .npy files a piece at a time.
+Builds that produce arrays too large to hold in memory append the pieces to a raw file as they
+are computed and turn it into an .npy file at the end, going through a memory map instead of
+reading the raw file back in. Like every artifact file, the .npy file is only moved into place
+once it is complete (see atomic.py)."""
+
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from .atomic import replacing, save_array
+
+
+@contextmanager
+def new_array(path, dtype, shape):
+    """Create an .npy file of the given shape and yield it memory-mapped, to be filled in the block.
+    It is written under a temporary name and replaces path when the block finishes.
+    """
+    if not shape[0]:
+        # an empty array cannot be memory-mapped, and there is nothing to fill
+        out = np.zeros(shape, dtype=dtype)
+        yield out
+        save_array(path, out)
+        return
+    with replacing(path) as tmp_path:
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+        yield out
+        out.flush()
+
+
+def copy_raw(raw_path, path, dtype, shape):
+    """Turn a raw binary file into an .npy file without reading it into memory at once."""
+    with new_array(path, dtype, shape) as out:
+        if shape[0]:
+            out[:] = np.memmap(raw_path, dtype=dtype, mode="r", shape=shape)
+
+
+class SpillFile:
+    """1D .npy file written by appending pieces to a raw file, finished by close()."""
+
+    def __init__(self, path, dtype):
+        """
+        :param path: .npy file to write
+        :param dtype: dtype of the array
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.raw_path = path + ".tmp"
+        self.length = 0
+        self._file = open(self.raw_path, "wb")
+
+    def write(self, values):
+        """Append values to the array (cast to its dtype)."""
+        values = np.asarray(values, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self.length += len(values)
+
+    def close(self):
+        self._file.close()
+        copy_raw(self.raw_path, self.path, self.dtype, (self.length,))
+        os.remove(self.raw_path)
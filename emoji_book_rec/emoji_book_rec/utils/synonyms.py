@@ -0,0 +1,71 @@
+"""WordNet synonym expansion for the keyword list, with a persisted cache.
+The expansion (keyword -> sorted synonyms) is stored as JSON together with a hash of the keyword
+list it was built for, so index builds only need NLTK and WordNet when the keyword list changes."""
+
+import hashlib
+import json
+import os
+
+SYNONYMS_PATH = "emoji_book_rec/data/synonyms.json"
+
+
+def get_synonyms(word):
+    """Get a set of synonyms for a word using WordNet.
+    :param word: The word to find synonyms for.
+    :return: A set of synonyms for the word.
+    """
+    # imported here so loading the cache never pays for NLTK and the WordNet corpus
+    from nltk.corpus import wordnet
+
+    synonyms = set()
+    for syn in wordnet.synsets(word):
+        for lemma in syn.lemmas():
+            synonyms.add(lemma.name().lower().replace("_", " "))
+    return synonyms
+
+
+def keyword_list_hash(keywords):
+    """Version hash of a keyword list (order and duplicates do not matter).
+    :param keywords: Iterable of keywords
+    :return: Hex digest
+    """
+    payload = json.dumps(sorted(set(keywords)))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_synonyms(keywords, path=SYNONYMS_PATH):
+    """Get the WordNet synonyms of every keyword, from the cache file when possible.
+    If the cache was built for a different keyword list, entries for keywords it already has are
+    reused, only the new keywords are looked up in WordNet, and the cache is rewritten.
+    :param keywords: Iterable of keywords
+    :param path: Path to the synonym cache JSON file, or None to always use WordNet
+    :return: Dict mapping each keyword to its sorted list of synonyms
+    """
+    keywords = sorted(set(keywords))
+    version = keyword_list_hash(keywords)
+
+    cached = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("keywords_hash") == version:
+            return cache["synonyms"]
+        cached = cache.get("synonyms", {})
+
+    synonyms = {kw: cached[kw] if kw in cached else sorted(get_synonyms(kw)) for kw in keywords}
+
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"keywords_hash": version, "synonyms": synonyms}, f, indent=1)
+    return synonyms
+
+
+def expand_keywords(keywords, path=SYNONYMS_PATH):
+    """Expand keywords into the strings to count for each of them.
+    :param keywords: List of keywords, in the order the expansion should keep
+    :param path: Path to the synonym cache JSON file, or None to always use WordNet
+    :return: Dict mapping each keyword to the set of its synonyms plus the keyword itself
+    """
+    synonyms = load_synonyms(keywords, path)
+    return {kw: set(synonyms[kw]) | {kw} for kw in keywords}  # include the keyword itself
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import save_matrix
+
+KEYWORD_HEADER = "Emoji\tKeyword 1\tKeyword 2\tKeyword 3\tKeyword 4\tKeyword 5"
+
+
+@pytest.fixture
+def write_keyword_list(tmp_path):
+    """Factory writing an emoji keyword list TSV from a dict of emoji -> its 5 keywords.
+    Returns the path as a string; the file is tmp_path/emoji_keyword_list.tsv unless a path is given."""
+
+    def write(emoji_keywords, path=None):
+        path = path or tmp_path / "emoji_keyword_list.tsv"
+        lines = [KEYWORD_HEADER] + ["\t".join([emoji, *keywords]) for emoji, keywords in emoji_keywords.items()]
+        path.write_text("\n".join(lines) + "\n")
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def make_artifacts(tmp_path, write_keyword_list):
+    """Factory writing a keyword list and a matrix artifact (sparse CSR unless dense=True).
+    Returns (keyword list path, matrix directory); the matrix goes into tmp_path unless matrix_dir is given."""
+
+    def make(emoji_keywords, values, keywords, books, dense=False, matrix_dir=None):
+        matrix_dir = matrix_dir or tmp_path
+        values = np.asarray(values)
+        save_matrix(matrix_dir, values if dense else sparse.csr_matrix(values), keywords, books)
+        return write_keyword_list(emoji_keywords), str(matrix_dir)
+
+    return make
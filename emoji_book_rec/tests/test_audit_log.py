@@ -0,0 +1,82 @@
+import json
+import logging
+import queue
+
+import numpy as np
+
+from emoji_book_rec.emoji_book_rec.utils.audit_log import AuditLog, BoundedQueueHandler, audit, audit_enabled
+from emoji_book_rec.emoji_book_rec.utils.query import AUDIT_RESULTS, QueryEngine
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_queries_are_audited_as_json_lines(tmp_path, make_artifacts):
+    keyword_file, matrix_dir = make_artifacts(
+        {"skull": ["dark", "dark", "fun", "dark", "fun"]},
+        [[1.0, 0.0, 0.5], [0.0, 2.0, 0.0]],
+        ["dark", "fun"],
+        ["Book A", "Book B", "Livre Ç"],
+    )
+    engine = QueryEngine(keyword_file, matrix_dir)
+    log_path = tmp_path / "audit.jsonl"
+
+    engine.query(["skull"], top_k=2)  # nothing is written without a running audit log
+    with AuditLog(str(log_path)):
+        results = engine.query(["skull"], top_k=3, return_all=True)
+        engine.query(["skull"], top_k=3, return_all=True)
+    assert not audit_enabled()
+
+    first, second = read_lines(log_path)
+    assert first["event"] == "query"
+    assert first["query"] == ["skull"]
+    assert first["top_k"] is None
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert [tuple(r) for r in first["results"]] == results
+    assert first["n_results"] == 3
+    assert first["duration_ms"] >= 0
+
+
+def test_audit_log_gets_more_results_than_asked_for(tmp_path, make_artifacts):
+    n_books = AUDIT_RESULTS + 5
+    keyword_file, matrix_dir = make_artifacts(
+        {"skull": ["dark", "dark", "dark", "dark", "dark"]},
+        [np.arange(n_books, 0, -1.0)],
+        ["dark"],
+        [f"Book {j}" for j in range(n_books)],
+    )
+    engine = QueryEngine(keyword_file, matrix_dir)
+    log_path = tmp_path / "audit.jsonl"
+
+    with AuditLog(str(log_path)):
+        results = engine.query(["skull"], top_k=5)
+        assert engine.query(["skull"], top_k=5) == results
+    assert [title for title, _ in results] == [f"Book {j}" for j in range(5)]
+
+    for record in read_lines(log_path):
+        assert record["n_results"] == 5
+        assert [title for title, _ in record["results"]] == [f"Book {j}" for j in range(AUDIT_RESULTS)]
+
+
+def test_full_queue_drops_records():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_rotation_and_drop_summary(tmp_path):
+    log_path = tmp_path / "audit.jsonl"
+    log = AuditLog(str(log_path), max_bytes=500, backup_count=2, queue_size=1000).start()
+    for i in range(50):
+        audit("query", query=["skull"], n=i)
+    log.handler.dropped = 4  # as if the writer had fallen behind
+    log.stop()
+
+    rotated = sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("audit.jsonl."))
+    assert rotated == ["audit.jsonl.1", "audit.jsonl.2"]
+    last = read_lines(log_path)[-1]
+    assert (last["event"], last["level"], last["dropped"]) == ("audit_dropped", "WARNING", 4)
+    assert read_lines(log_path)[-2]["n"] == 49
@@ -0,0 +1,35 @@
+import json
+
+import pandas as pd
+
+from emoji_book_rec.emoji_book_rec.utils.benchmark import random_queries, run_benchmark, synthetic_catalogue
+from emoji_book_rec.emoji_book_rec.utils.index_builder import IndexBuilder
+from emoji_book_rec.emoji_book_rec.utils.synonyms import keyword_list_hash
+
+
+def test_synthetic_catalogue_is_reproducible(tmp_path):
+    first = pd.read_csv(synthetic_catalogue(tmp_path / "a.csv", 250, seed=3))
+    second = pd.read_csv(synthetic_catalogue(tmp_path / "b.csv", 250, seed=3))
+    assert len(first) == 250
+    assert list(first.columns) == ["Title", "Authors", "Description"]
+    assert first.equals(second)
+    assert not first.equals(pd.read_csv(synthetic_catalogue(tmp_path / "c.csv", 250, seed=4)))
+
+    queries = random_queries(["a", "b", "c", "d", "e", "f"], 50)
+    assert all(1 <= len(q) <= 5 and len(set(q)) == len(q) for q in queries)
+
+
+def test_benchmark_results_are_json(tmp_path):
+    # an empty synonym cache for the real keyword list, so WordNet is not needed
+    keywords = IndexBuilder(None).load_keywords()
+    synonym_file = tmp_path / "synonyms.json"
+    synonym_file.write_text(
+        json.dumps({"keywords_hash": keyword_list_hash(keywords), "synonyms": {kw: [] for kw in keywords}})
+    )
+    results = run_benchmark([300], work_dir=tmp_path, synonym_path=str(synonym_file), n_queries=10, batch_size=4)
+
+    (run,) = json.loads(json.dumps(results))["runs"]
+    assert run["build"]["n_books"] == 300
+    assert run["query"]["warm"]["n"] == 10
+    assert run["query"]["fresh_engine"]["p50_ms"] > 0
+    assert run["query"]["batch"]["queries_per_s"] > 0
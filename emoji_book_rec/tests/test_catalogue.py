@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from emoji_book_rec.emoji_book_rec.utils.catalogue import (
+    LABELS_FILE,
+    OFFSETS_FILE,
+    BookCatalogue,
+    load_catalogue,
+    save_catalogue,
+)
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import BOOKS_FILE, load_matrix, save_matrix
+
+
+def test_catalogue_round_trip(tmp_path):
+    labels = ["Dune Frank Herbert", "", "Les Misérables Victor Hugo", "Dune Frank Herbert", "东京 著者"]
+    save_catalogue(tmp_path, labels)
+    catalogue = load_catalogue(tmp_path)
+
+    assert isinstance(catalogue.pool, np.memmap)
+    assert len(catalogue) == 5
+    assert list(catalogue) == labels
+    assert catalogue[np.int64(2)] == "Les Misérables Victor Hugo"
+    assert catalogue[-1] == "东京 著者"
+    with pytest.raises(IndexError):
+        catalogue[5]
+
+    # saving over the files the catalogue is mapped from
+    save_catalogue(tmp_path, catalogue)
+    assert list(load_catalogue(tmp_path)) == labels
+    assert len(BookCatalogue.from_labels([])) == 0
+
+
+def test_duplicate_books_keep_their_own_columns(tmp_path):
+    books = ["Same Title Same Author", "Other Book Someone", "Same Title Same Author"]
+    save_matrix(tmp_path, sparse.csr_matrix(np.array([[1.0, 0.0, 2.0]])), ["kw"], books)
+    matrix = load_matrix(tmp_path)
+    assert list(matrix.books) == books
+    assert not os.path.exists(tmp_path / BOOKS_FILE)
+
+
+def test_old_artifacts_with_books_json_still_load(tmp_path):
+    save_matrix(tmp_path, sparse.csr_matrix(np.array([[1.0, 0.0]])), ["kw"], ["A", "B"])
+    for name in (LABELS_FILE, OFFSETS_FILE):
+        os.remove(tmp_path / name)
+    (tmp_path / BOOKS_FILE).write_text(json.dumps(["A", "B"]))
+    assert list(load_matrix(tmp_path).books) == ["A", "B"]
+
+
+def test_loaded_matrix_survives_a_rewrite(tmp_path):
+    save_matrix(tmp_path, sparse.csr_matrix(np.array([[1.0, 0.0, 2.0]])), ["kw"], ["A a", "B b", "C c"])
+    old = load_matrix(tmp_path)
+    # a much smaller artifact written over the one old is memory-mapped from
+    save_matrix(tmp_path, sparse.csr_matrix(np.array([[5.0]])), ["other"], ["D"])
+
+    assert list(old.books) == ["A a", "B b", "C c"]
+    assert old.row("kw").tolist() == [1.0, 0.0, 2.0]
+    assert list(load_matrix(tmp_path).books) == ["D"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".new")]
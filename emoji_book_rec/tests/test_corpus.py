@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from emoji_book_rec.emoji_book_rec.utils.corpus import (
+    CORPUS_FILE,
+    build_corpus,
+    corpus_is_current,
+    get_corpus,
+)
+from emoji_book_rec.emoji_book_rec.utils.matrix_builder import fingerprint_books
+
+
+def write_books(path, descriptions):
+    pd.DataFrame(
+        {
+            "Title": [f"Title {i}" for i in range(len(descriptions))],
+            "Authors": ["Author"] * len(descriptions),
+            "Description": descriptions,
+        }
+    ).to_csv(path, index=False)
+
+
+def test_corpus_round_trip(tmp_path):
+    books_path = tmp_path / "books.csv"
+    write_books(books_path, ["Dark WINE", None, "  ", "Ça Marche, Élan", "Fun\nand GOOD"])
+    corpus = build_corpus(str(books_path), str(tmp_path / "corpus"), chunk_size=2)
+
+    assert len(corpus) == 3
+    assert list(corpus.books) == ["Title 0 Author", "Title 3 Author", "Title 4 Author"]
+    assert corpus.chunk(0, 3) == ["dark wine", "ça marche, élan", "fun\nand good"]
+    assert corpus.chunk(1, 2) == ["ça marche, élan"]
+    assert corpus.chunk(3, 3) == []
+    assert isinstance(corpus.descriptions.pool, np.memmap)
+    expected = fingerprint_books(list(corpus.books), ["Dark WINE", "Ça Marche, Élan", "Fun\nand GOOD"])
+    assert np.array_equal(corpus.fingerprints, expected)
+    assert list(corpus.chunks(2)) == [(0, 2), (2, 3)]
+
+
+def test_corpus_is_only_rebuilt_when_the_csv_changes(tmp_path):
+    books_path, corpus_dir = tmp_path / "books.csv", str(tmp_path / "corpus")
+    write_books(books_path, ["One"])
+    assert not corpus_is_current(str(books_path), corpus_dir)
+    get_corpus(str(books_path), corpus_dir)
+    written = os.stat(os.path.join(corpus_dir, CORPUS_FILE)).st_mtime_ns
+
+    assert get_corpus(str(books_path), corpus_dir).chunk(0, 1) == ["one"]
+    assert os.stat(os.path.join(corpus_dir, CORPUS_FILE)).st_mtime_ns == written
+
+    write_books(books_path, ["One", "Two more"])
+    assert not corpus_is_current(str(books_path), corpus_dir)
+    assert get_corpus(str(books_path), corpus_dir).chunk(0, 2) == ["one", "two more"]
+
+    write_books(books_path, [])
+    assert len(get_corpus(str(books_path), corpus_dir)) == 0
@@ -1,9 +1,11 @@
 import pytest
 import pandas as pd
 
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import load_matrix
+
 @pytest.fixture
 def keyword_matrix():
-    return pd.read_csv("emoji_book_rec/data/keyword_book_matrix.tsv", sep="\t", index_col=0)
+    return load_matrix("emoji_book_rec/data/keyword_book_matrix")
 
 @pytest.fixture
 def emoji_keywords():
@@ -24,12 +26,12 @@ def raw_books():
 
 def test_keywords_in_matrix(emoji_keywords, keyword_matrix):
     all_keywords = {kw.strip().lower() for kws in emoji_keywords.values() for kw in kws}
-    matrix_keywords = {kw.strip().lower() for kw in keyword_matrix.index}
+    matrix_keywords = {kw.strip().lower() for kw in keyword_matrix.keywords}
     missing_keywords = all_keywords - matrix_keywords
     assert not missing_keywords, f"Missing keywords in matrix: {missing_keywords}"
 
 def test_books_in_matrix(keyword_matrix, raw_books):
-    matrix_books = set(keyword_matrix.columns)
+    matrix_books = set(keyword_matrix.books)
     book_titles_authors = {
         f"{row['Title']} {row['Authors']}" for _, row in raw_books.iterrows()
     }
@@ -0,0 +1,111 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from emoji_book_rec.emoji_book_rec.utils import index_builder
+from emoji_book_rec.emoji_book_rec.utils.create_kw_book_tsv import main
+from emoji_book_rec.emoji_book_rec.utils.index_builder import IndexBuilder
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import load_matrix
+from emoji_book_rec.emoji_book_rec.utils.query import PostingQueryEngine, QueryEngine
+from emoji_book_rec.emoji_book_rec.utils.synonyms import keyword_list_hash
+
+
+@pytest.fixture
+def inputs(tmp_path, write_keyword_list):
+    keyword_file = write_keyword_list(
+        {
+            "grinning_face": ["happy", "content", "positive", "fun", "good"],
+            "skull": ["death", "dark", "gothic", "haunted", "fun"],
+        }
+    )
+    keywords = ["content", "dark", "death", "fun", "good", "gothic", "happy", "haunted", "positive"]
+    synonym_file = tmp_path / "synonyms.json"
+    synonym_file.write_text(
+        json.dumps({"keywords_hash": keyword_list_hash(keywords), "synonyms": {kw: [] for kw in keywords}})
+    )
+    books_file = tmp_path / "books.csv"
+    pd.DataFrame(
+        {
+            "Title": ["Gloom", "Sunny", "Empty", "Ghosts"],
+            "Authors": ["A", "B", "C", "D"],
+            "Description": ["Dark and gothic death.", "A happy, fun, good day.", " ", "Haunted but fun."],
+        }
+    ).to_csv(books_file, index=False)
+    return str(books_file), keyword_file, str(synonym_file)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_builder_writes_every_artifact(tmp_path, inputs, dense):
+    books_file, keyword_file, synonym_file = inputs
+    builder = IndexBuilder(
+        books_file,
+        keyword_path=keyword_file,
+        out_dir=str(tmp_path / "matrix"),
+        postings_dir=str(tmp_path / "postings"),
+        synonym_path=synonym_file,
+        chunk_size=2,
+        incremental=True,
+        dense=dense,
+    )
+    summary = builder.build()
+    assert summary["status"] == "built"
+    assert summary["n_books"] == 3
+
+    engine = QueryEngine(keyword_file, str(tmp_path / "matrix"))
+    assert engine.matrix.is_sparse != dense
+    assert engine.emoji_index is not None
+    results = engine.query(["skull"], return_all=True)
+    assert results[0][0] == "Gloom A"
+    assert {title for title, _ in results} == {"Gloom A", "Sunny B", "Ghosts D"}
+    assert PostingQueryEngine(keyword_file, str(tmp_path / "postings")).query(["skull"], return_all=True) == results
+
+    assert builder.build()["status"] == "up to date"
+
+
+def test_failed_rebuild_keeps_the_previous_artifact(tmp_path, inputs, monkeypatch):
+    books_file, keyword_file, synonym_file = inputs
+    out_dir = tmp_path / "matrix"
+    IndexBuilder(books_file, keyword_file, str(out_dir), None, synonym_file).build()
+    engine = QueryEngine(keyword_file, str(out_dir))
+    expected = engine.query(["skull"], return_all=True, use_cache=False)
+    files = sorted(os.listdir(out_dir))
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(index_builder, "write_emoji_index", fail)
+    with pytest.raises(OSError):
+        IndexBuilder(books_file, keyword_file, str(out_dir), None, synonym_file, dense=True).build()
+
+    assert sorted(os.listdir(out_dir)) == files
+    # nor any half-built directory next to it
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("matrix.")]
+    assert engine.query(["skull"], return_all=True, use_cache=False) == expected
+    assert QueryEngine(keyword_file, str(out_dir)).query(["skull"], return_all=True) == expected
+
+
+def test_cli_does_not_download_when_asked_not_to(capsys):
+    with pytest.raises(SystemExit):
+        main(["--no-download"])
+    assert "--filepath is required" in capsys.readouterr().err
+
+
+def test_corpus_builds_match_csv_builds(tmp_path, inputs):
+    books_file, keyword_file, synonym_file = inputs
+    outputs = []
+    for name, corpus_dir in (("csv", None), ("corpus", str(tmp_path / "corpus"))):
+        out_dir = str(tmp_path / name)
+        IndexBuilder(books_file, keyword_file, out_dir, None, synonym_file, chunk_size=2, corpus_dir=corpus_dir).build()
+        outputs.append(load_matrix(out_dir))
+    csv_matrix, corpus_matrix = outputs
+    assert list(corpus_matrix.books) == list(csv_matrix.books)
+    assert (corpus_matrix.matrix != csv_matrix.matrix).nnz == 0
+
+    # an incremental build from the corpus lines up with the fingerprints of a CSV build
+    builder = IndexBuilder(
+        books_file, keyword_file, str(tmp_path / "csv"), None, synonym_file, incremental=True,
+        corpus_dir=str(tmp_path / "corpus"),
+    )
+    assert builder.build()["status"] == "up to date"
@@ -0,0 +1,81 @@
+import json
+import logging
+
+import pytest
+
+from emoji_book_rec.emoji_book_rec.utils.instrumentation import METRICS, Histogram, Metrics
+from emoji_book_rec.emoji_book_rec.utils.query import QueryEngine
+
+
+@pytest.fixture
+def metrics():
+    METRICS.enable()
+    METRICS.reset()
+    yield METRICS
+    METRICS.enable(False)
+    METRICS.reset()
+
+
+@pytest.fixture
+def engine(make_artifacts):
+    keyword_file, matrix_dir = make_artifacts(
+        {
+            "skull": ["death", "dark", "dark", "death", "fun"],
+            "grinning_face": ["happy", "fun", "fun", "happy", "happy"],
+        },
+        [[1.0, 0.0, 0.5], [0.0, 2.0, 0.0], [0.25, 0.0, 0.0], [0.0, 0.0, 3.0]],
+        ["dark", "death", "fun", "happy"],
+        ["Book A", "Book B", "Book C"],
+    )
+    return lambda: QueryEngine(keyword_file, matrix_dir)
+
+
+def test_histogram_and_prometheus_text():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.sum == pytest.approx(2.65)
+
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("queries")
+    with metrics.span("scoring"):
+        pass
+    assert metrics.snapshot() == {"counters": {}, "spans": {}}
+
+    metrics.enable()
+    metrics.inc("queries", 2)
+    metrics.observe("scoring", 0.5)
+    text = metrics.to_prometheus()
+    assert "emoji_book_rec_queries_total 2\n" in text
+    assert 'emoji_book_rec_span_seconds_bucket{span="scoring",le="0.1"} 0\n' in text
+    assert 'emoji_book_rec_span_seconds_bucket{span="scoring",le="+Inf"} 1\n' in text
+    assert 'emoji_book_rec_span_seconds_count{span="scoring"} 1\n' in text
+    assert json.loads(metrics.to_json())["spans"]["scoring"]["buckets"] == {"0.1": 0, "1.0": 1, "+Inf": 1}
+
+
+def test_query_stages_are_timed(metrics, engine):
+    engine = engine()
+    engine.query(["skull"], top_k=2)
+    engine.query(["skull"], top_k=2)
+    engine.query_batch([["skull"], ["grinning_face"]])
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {
+        "queries": 2, "cache_hits": 1, "cache_misses": 1, "batches": 1, "batch_queries": 2
+    }
+    for stage in ("keyword_dict_load", "matrix_load", "keyword_lookup", "scoring", "bonus", "top_k", "render"):
+        assert snapshot["spans"][stage]["count"] >= 1
+    assert snapshot["spans"]["query"]["count"] == 1
+
+
+def test_top_results_are_only_logged_at_debug_level(engine, caplog):
+    engine = engine()
+    with caplog.at_level(logging.INFO):
+        results = engine.query(["skull"], top_k=1, use_cache=False)
+    assert "Top 25" not in caplog.text
+
+    with caplog.at_level(logging.DEBUG):
+        assert engine.query(["skull"], top_k=1, use_cache=False) == results
+    assert "Top 25" in caplog.text
+    assert "Rank: 2, Title: Book A" in caplog.text
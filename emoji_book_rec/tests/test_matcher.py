@@ -0,0 +1,89 @@
+import random
+import re
+
+import pytest
+
+from emoji_book_rec.emoji_book_rec.utils.matcher import KeywordMatcher, TokenMatcher
+
+
+EXPANDED = {
+    "fun": {"fun", "merriment", "play"},
+    "art": {"art", "artistic creation"},
+    "party": {"party", "political party"},
+    "aa": {"aa", "aaa"},
+    "play": {"play", "drama"},
+}
+
+
+def reference_counts(expanded, text, word_boundary=False):
+    counts = {}
+    for i, (kw, syns) in enumerate(expanded.items()):
+        if word_boundary:
+            count = sum(len(re.findall(r"\b" + re.escape(syn) + r"\b", text)) for syn in syns)
+        else:
+            count = sum(text.count(syn) for syn in syns)
+        if count:
+            counts[i] = count
+    return counts
+
+
+@pytest.mark.parametrize("word_boundary", [False, True])
+def test_matches_reference(word_boundary):
+    matcher = KeywordMatcher(EXPANDED, word_boundary=word_boundary)
+    rng = random.Random(0)
+    words = ["fun", "funeral", "party", "art", "aaaa", "aa", "play", "drama", "political party", "x", "_aa"]
+    for _ in range(200):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 15)))
+        assert matcher.count(text) == reference_counts(EXPANDED, text, word_boundary), text
+
+
+def test_substring_and_word_boundary():
+    text = "a fun funeral at the party"
+    substring = KeywordMatcher(EXPANDED).count(text)
+    whole_words = KeywordMatcher(EXPANDED, word_boundary=True).count(text)
+    keywords = list(EXPANDED)
+
+    assert substring[keywords.index("fun")] == 2
+    assert substring[keywords.index("art")] == 1  # from "party"
+    assert whole_words[keywords.index("fun")] == 1
+    assert keywords.index("art") not in whole_words
+
+
+def test_overlapping_hits_follow_str_count():
+    matcher = KeywordMatcher({"aa": {"aa"}})
+    assert matcher.count("aaaaa") == {0: "aaaaa".count("aa")}
+
+
+def reference_token_counts(expanded, text):
+    tokens = re.findall(r"\w+", text)
+    counts = {}
+    for i, syns in enumerate(expanded.values()):
+        count = 0
+        for term in {tuple(re.findall(r"\w+", syn)) for syn in syns}:
+            j = 0
+            while j + len(term) <= len(tokens):
+                if tuple(tokens[j:j + len(term)]) == term:
+                    count += 1
+                    j += len(term)
+                else:
+                    j += 1
+        if count:
+            counts[i] = count
+    return counts
+
+
+def test_token_matcher_matches_reference():
+    expanded = {**EXPANDED, "ha": {"ha ha", "ha-ha-ha"}, "ice": {"ice cream", "ice-cream", "cream"}}
+    matcher = TokenMatcher(expanded)
+    rng = random.Random(1)
+    words = ["fun", "funeral", "party", "political party", "art", "aa", "ha", "ice", "cream", "ice-cream", ",", "x"]
+    for _ in range(300):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 15)))
+        assert matcher.count(text) == reference_token_counts(expanded, text), text
+
+
+def test_token_matcher_counts_exact_terms():
+    matcher = TokenMatcher({"fun": {"fun"}, "art": {"art"}, "ice": {"ice cream"}})
+    assert matcher.count("a fun funeral at the party") == {0: 1}
+    assert matcher.count("ice-cream, nice creamery and ice  cream") == {2: 2}
+    assert matcher.token_ids("the fun art") == [-1, 0, 1]
@@ -0,0 +1,148 @@
+import random
+
+import numpy as np
+import pytest
+
+from emoji_book_rec.emoji_book_rec.utils.matrix_builder import (
+    build_keyword_matrix,
+    fingerprint_books,
+    keyword_hashes,
+    score_chunks,
+    shard_ranges,
+    update_keyword_matrix,
+)
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import MatrixWriter, load_matrix, save_matrix
+
+
+EXPANDED = {
+    "dark": {"dark", "darkness"},
+    "fun": {"fun", "merriment"},
+    "happy": {"happy", "felicitous", "glad"},
+    "wine": {"wine", "vino"},
+}
+
+
+@pytest.fixture
+def descriptions():
+    rng = random.Random(0)
+    words = ["dark", "darkness", "fun", "funeral", "glad", "happy", "wine", "vino", "the", "a", "book"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 30))) for _ in range(150)]
+
+
+def test_shard_ranges_cover_all_books():
+    ranges = shard_ranges(10, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == 10
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert shard_ranges(3, 8) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_matrix_values(descriptions):
+    matrix = build_keyword_matrix(EXPANDED, descriptions)
+    for j, desc in enumerate(descriptions[:20]):
+        for i, syns in enumerate(EXPANDED.values()):
+            expected = sum(desc.count(syn) for syn in syns) / len(desc) * 100
+            assert matrix[i, j] == np.float32(expected)
+
+
+def test_workers_give_identical_matrix(descriptions):
+    single = build_keyword_matrix(EXPANDED, descriptions, workers=1)
+    parallel = build_keyword_matrix(EXPANDED, descriptions, workers=3)
+    for name in ("data", "indices", "indptr"):
+        assert np.array_equal(getattr(single, name), getattr(parallel, name))
+    assert single.shape == parallel.shape
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunked_build_matches_full_build(tmp_path, descriptions, workers):
+    books = [f"Book {j}" for j in range(len(descriptions))]
+    save_matrix(tmp_path / "full", build_keyword_matrix(EXPANDED, descriptions), list(EXPANDED), books)
+
+    # uneven chunks, including an empty one
+    bounds = [0, 7, 7, 64, 100, len(descriptions)]
+    chunks = [descriptions[a:b] for a, b in zip(bounds, bounds[1:])]
+    writer = MatrixWriter(tmp_path / "chunked", list(EXPANDED))
+    for (a, b), block in zip(zip(bounds, bounds[1:]), score_chunks(EXPANDED, chunks, workers=workers)):
+        writer.append(block, books[a:b])
+    writer.close()
+    assert writer.n_books == len(books)
+
+    full, chunked = load_matrix(tmp_path / "full"), load_matrix(tmp_path / "chunked")
+    for name in ("data", "indices", "indptr"):
+        assert np.array_equal(getattr(full.matrix, name), getattr(chunked.matrix, name))
+    assert np.array_equal(full.keyword_bits, chunked.keyword_bits)
+    assert list(chunked.books) == books
+    assert sorted(p.name for p in (tmp_path / "chunked").iterdir()) == sorted(
+        p.name for p in (tmp_path / "full").iterdir()
+    )
+
+
+def test_incremental_update_matches_full_build(descriptions):
+    books = [f"Book {j}" for j in range(len(descriptions))]
+    old = build_keyword_matrix(EXPANDED, descriptions)
+    old_fingerprints = fingerprint_books(books, descriptions)
+
+    # drop a few books, change one description and append new books
+    new_books = books[5:] + ["New 1", "New 2"]
+    new_descriptions = descriptions[5:] + ["dark wine", "happy happy fun"]
+    new_descriptions[10] = "a glad vino book"
+    fingerprints = fingerprint_books(new_books, new_descriptions)
+
+    updated, n_keywords_scored, n_scored = update_keyword_matrix(
+        old, keyword_hashes(EXPANDED), old_fingerprints, EXPANDED, new_descriptions, fingerprints
+    )
+    full = build_keyword_matrix(EXPANDED, new_descriptions)
+
+    assert (n_keywords_scored, n_scored) == (0, 3)
+    assert updated.shape == full.shape
+    for name in ("data", "indices", "indptr"):
+        assert np.array_equal(getattr(updated, name), getattr(full, name))
+
+
+def test_tokenized_build(descriptions):
+    matrix = build_keyword_matrix(EXPANDED, descriptions, tokenize=True)
+    for j, desc in enumerate(descriptions[:20]):
+        words = desc.split()
+        for i, syns in enumerate(EXPANDED.values()):
+            expected = sum(words.count(syn) for syn in syns) / len(desc) * 100
+            assert matrix[i, j] == np.float32(expected)
+
+    parallel = build_keyword_matrix(EXPANDED, descriptions, workers=3, tokenize=True)
+    assert (matrix != parallel).nnz == 0
+    # only whole words count, so "fun" no longer matches "funeral"
+    substring = build_keyword_matrix(EXPANDED, descriptions)
+    assert matrix[1].sum() < substring[1].sum()
+
+
+def test_fingerprints_change_with_content():
+    first = fingerprint_books(["A", "B"], ["some text", "other"])
+    assert np.array_equal(first, fingerprint_books(["A", "B"], ["some text", "other"]))
+    assert first[0] != fingerprint_books(["A"], ["some text!"])[0]
+
+
+def test_keyword_hashes_track_synonyms():
+    hashes = keyword_hashes(EXPANDED)
+    changed = keyword_hashes({**EXPANDED, "fun": {"fun"}})
+    assert [kw for kw in hashes if hashes[kw] != changed[kw]] == ["fun"]
+    assert all(a != b for a, b in zip(hashes.values(), keyword_hashes(EXPANDED, word_boundary=True).values()))
+    assert all(a != b for a, b in zip(hashes.values(), keyword_hashes(EXPANDED, tokenize=True).values()))
+
+
+def test_keyword_update_matches_full_build(descriptions):
+    books = [f"Book {j}" for j in range(len(descriptions))]
+    old = build_keyword_matrix(EXPANDED, descriptions)
+    fingerprints = fingerprint_books(books, descriptions)
+
+    # drop "dark", retune "fun", add "book" (sorted, like the real keyword list) and add one book
+    expanded = {"book": {"book"}, "fun": {"fun", "funeral"}, "happy": EXPANDED["happy"], "wine": EXPANDED["wine"]}
+    new_descriptions = descriptions + ["a fun book"]
+    new_fingerprints = fingerprint_books(books + ["New"], new_descriptions)
+
+    updated, n_keywords_scored, n_scored = update_keyword_matrix(
+        old, keyword_hashes(EXPANDED), fingerprints, expanded, new_descriptions, new_fingerprints, workers=2
+    )
+    full = build_keyword_matrix(expanded, new_descriptions)
+
+    assert (n_keywords_scored, n_scored) == (2, 1)
+    assert updated.shape == full.shape
+    for name in ("data", "indices", "indptr"):
+        assert np.array_equal(getattr(updated, name), getattr(full, name))
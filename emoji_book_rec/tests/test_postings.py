@@ -0,0 +1,123 @@
+
+import numpy as np
+import pytest
+
+from emoji_book_rec.emoji_book_rec.utils.emoji_index import build_emoji_index, load_emoji_index, write_emoji_index
+from emoji_book_rec.emoji_book_rec.utils.keyword_tsv_to_dict import generate_keyword_dict
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import KeywordBookMatrix, load_matrix
+from emoji_book_rec.emoji_book_rec.utils.postings import (
+    PostingIndex,
+    decode_varints,
+    encode_varints,
+    load_postings,
+    save_postings,
+    write_postings,
+)
+from emoji_book_rec.emoji_book_rec.utils.query import PostingQueryEngine, QueryEngine, process_query
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**31 - 1, 2**40, 5])
+    encoded = encode_varints(values)
+    assert encoded.dtype == np.uint8
+    assert len(encode_varints([0, 127])) == 2
+    assert len(encode_varints([128])) == 2
+    assert list(decode_varints(encoded)) == list(values)
+    assert len(decode_varints(encode_varints([]))) == 0
+
+
+def test_postings_round_trip(tmp_path):
+    lists = [
+        (np.array([7, 2, 300]), np.array([0.5, 1.5, 2.0])),
+        (np.zeros(0, dtype=np.int64), np.zeros(0)),
+        (np.array([0, 1, 20000]), np.array([3.0, 0.25, 1.0])),
+    ]
+    books = [f"Book {j}" for j in range(20001)]
+    index = PostingIndex.from_lists(["dark", "empty", "fun"], books, lists)
+    save_postings(tmp_path, index)
+
+    loaded = load_postings(tmp_path)
+    assert loaded.keywords == ["dark", "empty", "fun"]
+    assert len(loaded.books) == len(books)
+    assert loaded.books[20000] == "Book 20000"
+    assert not loaded.ids.flags.writeable
+    for kw, (book_ids, scores) in zip(loaded.keywords, lists):
+        ids, values = loaded.postings(kw)
+        order = np.argsort(book_ids)
+        assert list(ids) == list(book_ids[order])
+        assert list(values) == list(scores[order].astype(np.float32))
+
+    # saving a new index over the files loaded is memory-mapped from
+    save_postings(tmp_path, PostingIndex.from_lists(["dark"], ["Other"], [(np.array([0]), np.array([1.0]))]))
+    assert list(loaded.postings("fun")[0]) == [0, 1, 20000]
+    assert load_postings(tmp_path).keywords == ["dark"]
+
+
+@pytest.fixture
+def artifacts(tmp_path, make_artifacts):
+    rng = np.random.default_rng(5)
+    values = (rng.random((40, 500)) * (rng.random((40, 500)) < 0.05)).astype(np.float32)
+    emoji_keywords = {f"e{e}": [f"kw{k}" for k in rng.choice(45, size=5, replace=False)] for e in range(12)}
+    keyword_file, matrix_dir = make_artifacts(
+        emoji_keywords,
+        values,
+        [f"kw{i}" for i in range(40)],
+        [f"Book {j}" for j in range(500)],
+        matrix_dir=tmp_path / "matrix",
+    )
+    postings_dir = tmp_path / "postings"
+    save_postings(postings_dir, PostingIndex.from_matrix(load_matrix(matrix_dir)))
+    queries = [[f"e{e}" for e in rng.choice(12, size=rng.integers(1, 6))] for _ in range(30)] + [["unknown"]]
+    return keyword_file, matrix_dir, str(postings_dir), queries
+
+
+def test_posting_engine_matches_matrix_engine(artifacts):
+    keyword_file, matrix_dir, postings_dir, queries = artifacts
+    matrix_engine = QueryEngine(keyword_file, matrix_dir)
+    posting_engine = PostingQueryEngine(keyword_file, postings_dir)
+    # the postings are memory-mapped like the matrix
+    assert not posting_engine.postings.ids.flags.writeable
+
+    for q in queries:
+        assert posting_engine.query(q, return_all=True) == matrix_engine.query(q, return_all=True)
+        _, keyword_counts = posting_engine.keyword_counts(q)
+        for book in range(0, 500, 50):
+            found = posting_engine.keywords_found(keyword_counts, book)
+            assert found == matrix_engine.keywords_found(keyword_counts, book)
+    assert posting_engine.query_batch(queries, top_k=5) == matrix_engine.query_batch(queries, top_k=5)
+
+    assert process_query(queries[0], keyword_file, False, postings_path=postings_dir, top_k=3) == (
+        matrix_engine.query(queries[0], top_k=3)
+    )
+    with pytest.raises(ValueError):
+        process_query(queries[0], keyword_file, False)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_streamed_indexes_match_in_memory_ones(tmp_path, artifacts, dense):
+    keyword_file, matrix_dir, postings_dir, _ = artifacts
+    matrix = load_matrix(matrix_dir)
+    if dense:
+        matrix = KeywordBookMatrix(matrix.matrix.toarray(), matrix.keywords, matrix.books)
+
+    emoji_kw_dict = generate_keyword_dict(keyword_file)
+    write_emoji_index(str(tmp_path / "streamed"), emoji_kw_dict, matrix)
+    streamed = load_emoji_index(str(tmp_path / "streamed"), matrix)
+    expected = build_emoji_index(emoji_kw_dict, matrix)
+    assert streamed.emojis == expected.emojis
+    assert streamed.keywords_hash == expected.keywords_hash
+    assert np.array_equal(streamed.keyword_masks, expected.keyword_masks)
+    for name in ("data", "indices", "indptr"):
+        assert np.array_equal(getattr(streamed.scores, name), getattr(expected.scores, name))
+    # every emoji row is its keyword rows added up, repeated keywords counted again
+    dense_rows = np.asarray(matrix.matrix.toarray() if matrix.is_sparse else matrix.matrix, dtype=np.float64)
+    for e, keywords in enumerate(emoji_kw_dict.values()):
+        row = sum((dense_rows[matrix.keyword_index[kw]] for kw in keywords if kw in matrix), np.zeros(500))
+        assert np.allclose(expected.scores[e].toarray().ravel(), row)
+
+    write_postings(str(tmp_path / "postings"), matrix)
+    streamed, expected = load_postings(str(tmp_path / "postings")), load_postings(postings_dir)
+    assert streamed.keywords == expected.keywords
+    assert list(streamed.books) == list(expected.books)
+    for name in ("ids", "id_offsets", "scores", "indptr"):
+        assert np.array_equal(getattr(streamed, name), getattr(expected, name))
@@ -0,0 +1,324 @@
+import os
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from emoji_book_rec.emoji_book_rec.utils.bitsets import mask_rows, popcount
+from emoji_book_rec.emoji_book_rec.utils.emoji_index import build_emoji_index, save_emoji_index
+from emoji_book_rec.emoji_book_rec.utils.keyword_tsv_to_dict import generate_keyword_dict
+from emoji_book_rec.emoji_book_rec.utils import query as query_module
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import CSR_DATA_FILE, load_matrix, save_matrix
+from emoji_book_rec.emoji_book_rec.utils.postings import PostingIndex, save_postings
+from emoji_book_rec.emoji_book_rec.utils.query import (
+    PostingQueryEngine,
+    QueryEngine,
+    get_engine,
+    process_queries,
+    process_query,
+    top_k_indices,
+)
+from emoji_book_rec.emoji_book_rec.utils.query_cache import QueryCache
+
+
+@pytest.fixture
+def keyword_file(write_keyword_list):
+    return write_keyword_list(
+        {
+            "grinning_face": ["happy", "content", "positive", "fun", "good"],
+            "skull": ["death", "dark", "gothic", "haunted", "fun"],
+        }
+    )
+
+
+@pytest.fixture
+def matrix_file(tmp_path):
+    keywords = ["content", "dark", "death", "fun", "good", "gothic", "happy", "haunted", "positive"]
+    books = ["Book A Author A", "Book B Author B", "Book C Author C", "Book D Author D"]
+    values = [
+        [0.5, 0.0, 0.0, 0.0],
+        [0.0, 1.25, 0.0, 0.0],
+        [0.0, 2.0, 0.0, 0.0],
+        [0.75, 0.5, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [3.0, 0.0, 0.1, 0.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [0.0, 0.0, 0.2, 0.0],
+    ]
+    path = tmp_path / "keyword_book_matrix"
+    save_matrix(path, sparse.csr_matrix(np.array(values)), keywords, books)
+    return str(path)
+
+
+def test_engine_scores(keyword_file, matrix_file):
+    engine = QueryEngine(keyword_file, matrix_file)
+    results = dict(engine.query(["grinning_face"], return_all=True))
+
+    # happy is weighted 3 times, every matched keyword adds a 1.5 bonus
+    assert results["Book A Author A"] == pytest.approx(3.0 * 3 + 0.5 + 0.75 + 1.5 * 3)
+    assert results["Book C Author C"] == pytest.approx(0.1 * 3 + 0.2 + 1.5 * 2)
+    assert "Book D Author D" not in results
+
+
+def test_matrix_is_memory_mapped(matrix_file):
+    matrix = load_matrix(matrix_file)
+    assert matrix.is_sparse
+    assert matrix.matrix.nnz == 8
+    # a read-only view means the arrays were mapped from disk rather than copied
+    assert not matrix.matrix.data.flags.writeable
+    assert not matrix.matrix.indices.flags.writeable
+    assert matrix.matrix.dtype == np.float32
+    assert matrix.row("dark")[1] == 1.25
+
+
+def test_dense_matches_sparse(tmp_path, keyword_file, matrix_file):
+    matrix = load_matrix(matrix_file)
+    dense_path = tmp_path / "dense_matrix"
+    save_matrix(dense_path, matrix.matrix.toarray(), matrix.keywords, matrix.books)
+    assert isinstance(load_matrix(dense_path).matrix, np.memmap)
+
+    sparse_results = QueryEngine(keyword_file, matrix_file).query(["grinning_face", "skull"])
+    dense_results = QueryEngine(keyword_file, str(dense_path)).query(["grinning_face", "skull"])
+    assert sparse_results == dense_results
+
+
+def test_engine_is_reused(keyword_file, matrix_file):
+    first = process_query(["skull"], keyword_file, True, matrix_file)
+    engine = get_engine(keyword_file, matrix_file)
+    assert get_engine(keyword_file, matrix_file) is engine
+    assert process_query(["skull"], keyword_file, True, matrix_file) == first
+    assert engine.cache.stats()["hits"] == 1
+
+
+def test_result_cache_key_is_the_emoji_multiset(keyword_file, matrix_file):
+    engine = QueryEngine(keyword_file, matrix_file)
+    first = engine.query(["grinning_face", "skull"], top_k=2)
+    assert engine.query(["skull", "grinning_face"], top_k=2) == first
+    engine.query(["skull", "grinning_face", "skull"], top_k=2)
+    engine.query(["skull", "grinning_face"], top_k=3)
+    assert engine.cache.stats()["hits"] == 1
+    assert engine.cache.stats()["misses"] == 3
+
+
+def test_cache_lru_and_ttl():
+    now = [0.0]
+    cache = QueryCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") == (False, None)
+    now[0] = 11
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["evictions"] == 1 and cache.stats()["expirations"] == 1
+
+
+def test_engine_reloads_when_matrix_changes(keyword_file, matrix_file, monkeypatch):
+    monkeypatch.setattr(query_module, "VERSION_CHECK_INTERVAL", 0)
+    engine = get_engine(keyword_file, matrix_file)
+    engine.query(["skull"])
+    matrix = load_matrix(matrix_file)
+    save_matrix(matrix_file, matrix.matrix.toarray() * 2, matrix.keywords, matrix.books)
+
+    reloaded = get_engine(keyword_file, matrix_file)
+    assert reloaded is not engine
+    assert len(reloaded.cache) == 0
+    assert reloaded.query(["skull"]) != engine.query(["skull"])
+
+
+def test_failed_reload_keeps_the_loaded_engine(keyword_file, matrix_file, monkeypatch):
+    monkeypatch.setattr(query_module, "VERSION_CHECK_INTERVAL", 0)
+    engine = get_engine(keyword_file, matrix_file)
+    expected = engine.query(["skull"], use_cache=False)
+    matrix = load_matrix(matrix_file)
+    values = matrix.matrix.toarray()
+    # caught halfway through being swapped out by a build
+    os.remove(os.path.join(matrix_file, CSR_DATA_FILE))
+
+    assert get_engine(keyword_file, matrix_file) is engine
+    assert engine.query(["skull"], use_cache=False) == expected
+
+    save_matrix(matrix_file, values * 2, matrix.keywords, matrix.books)
+    assert get_engine(keyword_file, matrix_file) is not engine
+
+
+def test_version_check_is_throttled(keyword_file, matrix_file, monkeypatch):
+    engine = get_engine(keyword_file, matrix_file)
+    checks = []
+    real_version = query_module.artifact_version
+    monkeypatch.setattr(query_module, "artifact_version", lambda *paths: checks.append(paths) or real_version(*paths))
+    for _ in range(5):
+        assert get_engine(keyword_file, matrix_file) is engine
+    assert checks == []
+
+    monkeypatch.setattr(query_module, "VERSION_CHECK_INTERVAL", 0)
+    assert get_engine(keyword_file, matrix_file) is engine
+    assert len(checks) == 1
+
+
+def test_matrix_path_required(keyword_file):
+    with pytest.raises(ValueError):
+        process_query(["skull"], keyword_file, True, None)
+
+
+def reference_scores(matrix, keyword_counts):
+    # the original per-cell scoring loop, kept here to check the vectorized version against
+    book_scores = {}
+    book_keyword_sets = {}
+    for kw, count in keyword_counts.items():
+        if kw in matrix:
+            for j, freq in enumerate(matrix.row(kw)):
+                if freq > 0:
+                    book_keyword_sets.setdefault(matrix.books[j], set()).add(kw)
+                    book_scores[matrix.books[j]] = book_scores.get(matrix.books[j], 0) + float(freq) * count
+    return {title: score + 1.5 * len(book_keyword_sets[title]) for title, score in book_scores.items()}
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_vectorized_scores_match_loop(make_artifacts, dense):
+    rng = np.random.default_rng(0)
+    keyword_file, matrix_dir = make_artifacts(
+        {"a": ["kw1", "kw2", "kw3", "kw4", "kw5"], "b": ["kw5", "kw7", "kw11", "kw13", "missing"]},
+        rng.random((20, 300)) * (rng.random((20, 300)) < 0.2),
+        [f"kw{i}" for i in range(20)],
+        [f"Book {j}" for j in range(300)],
+        dense=dense,
+    )
+    engine = QueryEngine(keyword_file, matrix_dir)
+    _, keyword_counts = engine.keyword_counts(["a", "b"])
+
+    results = engine.query(["a", "b"], return_all=True)
+    assert dict(results) == reference_scores(engine.matrix, keyword_counts)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_ties_rank_in_first_match_order(make_artifacts, tmp_path, dense):
+    rng = np.random.default_rng(4)
+    # small whole-number scores, so many books tie
+    values = rng.integers(1, 3, size=(20, 300)) * (rng.random((20, 300)) < 0.2)
+    keyword_file, matrix_dir = make_artifacts(
+        {"a": ["kw7", "kw2", "kw3", "kw4", "kw5"], "b": ["kw5", "kw1", "kw11", "kw13", "kw0"]},
+        values.astype(float),
+        [f"kw{i}" for i in range(20)],
+        [f"Book {j}" for j in range(300)],
+        dense=dense,
+    )
+    engine = QueryEngine(keyword_file, matrix_dir)
+    query = ["b", "a"]
+    _, keyword_counts = engine.keyword_counts(query)
+    # the original loop's dict holds the books in the order their first keyword reached them, and sorted() is stable
+    expected = sorted(reference_scores(engine.matrix, keyword_counts).items(), key=lambda x: x[1], reverse=True)
+    postings_dir = tmp_path / "postings"
+    save_postings(postings_dir, PostingIndex.from_matrix(engine.matrix))
+    save_emoji_index(matrix_dir, build_emoji_index(generate_keyword_dict(keyword_file), engine.matrix))
+    engines = [engine, QueryEngine(keyword_file, matrix_dir), PostingQueryEngine(keyword_file, str(postings_dir))]
+    assert engines[1].emoji_index is not None
+
+    for e in engines:
+        assert e.query(query, return_all=True) == expected
+        for k in (1, 5, 25):
+            assert e.query(query, top_k=k) == expected[:k]
+            assert e.query_batch([query, ["a"]], top_k=k)[0] == expected[:k]
+
+
+def test_top_k_matches_full_sort():
+    rng = np.random.default_rng(1)
+    # few distinct values so there are plenty of ties at the cut-off
+    scores = rng.integers(0, 6, size=500).astype(float)
+    candidates = np.flatnonzero(scores)
+    full = candidates[np.argsort(-scores[candidates], kind="stable")]
+    for k in (1, 5, 25, len(candidates), len(candidates) + 10):
+        assert list(top_k_indices(scores, candidates, k)) == list(full[:k])
+
+
+def test_query_top_k(keyword_file, matrix_file):
+    engine = QueryEngine(keyword_file, matrix_file)
+    everything = engine.query(["grinning_face", "skull"], return_all=True)
+    assert len(everything) == 3
+    assert engine.query(["grinning_face", "skull"], top_k=2) == everything[:2]
+    assert process_query(["grinning_face", "skull"], keyword_file, True, matrix_file, top_k=1) == everything[:1]
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_batch_matches_single_queries(make_artifacts, dense):
+    rng = np.random.default_rng(2)
+    values = (rng.random((30, 400)) * (rng.random((30, 400)) < 0.15)).astype(np.float32)
+    keyword_file, matrix_dir = make_artifacts(
+        {f"e{e}": [f"kw{k}" for k in rng.choice(35, size=5, replace=False)] for e in range(12)},
+        values,
+        [f"kw{i}" for i in range(30)],
+        [f"Book {j}" for j in range(400)],
+        dense=dense,
+    )
+
+    engine = QueryEngine(keyword_file, matrix_dir)
+    queries = [[f"e{e}" for e in rng.choice(12, size=rng.integers(1, 6))] for _ in range(40)] + [["unknown"]]
+    assert engine.query_batch(queries, top_k=10) == [engine.query(q, top_k=10) for q in queries]
+
+
+def test_process_queries_streams_batches(keyword_file, matrix_file):
+    engine = get_engine(keyword_file, matrix_file)
+    pairs = [["grinning_face", "skull"], ["skull"], ["grinning_face"], ["skull", "skull"], ["nothing"]]
+    consumed = []
+
+    def queries():
+        for q in pairs:
+            consumed.append(q)
+            yield q
+
+    stream = process_queries(queries(), keyword_file, matrix_file, top_k=2, batch_size=2)
+    first = next(stream)
+    # only the first batch has been read from the input so far
+    assert len(consumed) == 2
+    assert first == (pairs[0], engine.query(pairs[0], top_k=2))
+    assert list(stream) == [(q, engine.query(q, top_k=2)) for q in pairs[1:]]
+
+
+def test_popcount():
+    rng = np.random.default_rng(3)
+    words = rng.integers(0, 2**63, size=(50, 3), dtype=np.uint64) | np.uint64(2**63)
+    assert list(popcount(words)) == [sum(bin(int(w)).count("1") for w in row) for row in words]
+
+
+def test_keyword_bits_are_stored_and_decoded(keyword_file, matrix_file):
+    matrix = load_matrix(matrix_file)
+    # memory-mapped from the artifact like the matrix itself
+    assert not matrix.keyword_bits.flags.writeable
+    assert list(mask_rows(matrix.keyword_mask(["happy", "fun", "missing"]))) == [3, 6]
+
+    engine = QueryEngine(keyword_file, matrix_file)
+    _, keyword_counts = engine.keyword_counts(["grinning_face", "skull"])
+    assert engine.keywords_found(keyword_counts, 0) == {"content", "fun", "happy"}
+    assert engine.keywords_found(keyword_counts, 1) == {"dark", "death", "fun"}
+    assert engine.keywords_found(keyword_counts, 3) == set()
+
+
+def test_emoji_index_matches_keyword_scores(tmp_path, make_artifacts, write_keyword_list):
+    rng = np.random.default_rng(4)
+    values = (rng.random((150, 300)) * (rng.random((150, 300)) < 0.1)).astype(np.float32)
+    # emojis share keywords, which the distinct keyword bonus must only count once
+    emoji_keywords = {f"e{e}": [f"kw{k}" for k in rng.choice(155, size=5, replace=False)] for e in range(10)}
+    # more than 64 keywords, so the keyword bitsets span several words
+    keyword_file, matrix_dir = make_artifacts(
+        emoji_keywords, values, [f"kw{i}" for i in range(150)], [f"Book {j}" for j in range(300)]
+    )
+    queries = [[f"e{e}" for e in rng.choice(10, size=rng.integers(1, 6))] for _ in range(30)] + [["unknown"]]
+
+    plain = QueryEngine(keyword_file, matrix_dir)
+    assert plain.emoji_index is None
+    save_emoji_index(tmp_path, build_emoji_index(generate_keyword_dict(keyword_file), plain.matrix))
+    engine = QueryEngine(keyword_file, matrix_dir)
+    assert engine.emoji_index is not None
+
+    for q in queries:
+        expected = dict(plain.query(q, return_all=True))
+        results = dict(engine.query(q, return_all=True))
+        assert results.keys() == expected.keys()
+        assert list(results.values()) == pytest.approx(list(expected.values()))
+    assert engine.query_batch(queries, top_k=10) == [engine.query(q, top_k=10) for q in queries]
+
+    # the per-emoji scores are ignored once the keyword list no longer matches them
+    write_keyword_list(dict(list(emoji_keywords.items())[:-1]))
+    assert QueryEngine(keyword_file, matrix_dir).emoji_index is None
@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from emoji_book_rec.emoji_book_rec.bin.server import RecommendationServer, normalize_emojis
+from emoji_book_rec.emoji_book_rec.utils.audit_log import AuditLog
+from emoji_book_rec.emoji_book_rec.utils import query as query_module
+from emoji_book_rec.emoji_book_rec.utils.matrix_store import load_matrix, save_matrix
+from emoji_book_rec.emoji_book_rec.utils.query import AUDIT_RESULTS, QueryEngine
+
+
+@pytest.fixture
+def engine(make_artifacts):
+    rng = np.random.default_rng(3)
+    keyword_file, matrix_dir = make_artifacts(
+        {
+            "grinning_face": ["happy", "fun", "good", "fun", "happy"],
+            "skull": ["death", "dark", "dark", "death", "fun"],
+            "wine_glass": ["wine", "fun", "good", "dark", "happy"],
+        },
+        rng.random((6, 50)) * (rng.random((6, 50)) < 0.4),
+        ["dark", "death", "fun", "good", "happy", "wine"],
+        [f"Book {j}" for j in range(50)],
+    )
+    return QueryEngine(keyword_file, matrix_dir)
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_normalize_emojis():
+    assert normalize_emojis(["\U0001F480", ":skull:", "wine_glass"]) == ["skull", "skull", "wine_glass"]
+
+
+def test_concurrent_requests_are_batched(engine):
+    queries = [["skull"], ["grinning_face", "wine_glass"], ["wine_glass"], ["skull", "grinning_face"]] * 5
+
+    async def run():
+        server = RecommendationServer(engine, max_batch=32, max_delay=0.05)
+        _, port = await server.start("127.0.0.1", 0)
+        try:
+            responses = await asyncio.gather(
+                *(request(port, "POST", "/recommend", {"emojis": q, "top_k": 3}) for q in queries)
+            )
+            health = await request(port, "GET", "/health")
+            bad = await request(port, "POST", "/recommend", {"emojis": []})
+        finally:
+            await server.stop()
+        return responses, health, bad, server.batcher.batches
+
+    responses, health, bad, batches = asyncio.run(run())
+
+    for q, (status, payload) in zip(queries, responses):
+        assert status == 200
+        assert [(r["title"], r["score"]) for r in payload["results"]] == engine.query(q, top_k=3)
+    # only 4 distinct queries, the repeats may be served from the cache instead of a batch
+    assert batches < len(queries)
+    assert health[0] == 200
+    assert health[1]["queries"] + health[1]["cache"]["hits"] == len(queries)
+    assert bad[0] == 400
+
+
+def test_errors_get_a_response(engine, monkeypatch):
+    def fail(queries, top_k):
+        raise RuntimeError("scoring failed")
+
+    monkeypatch.setattr(engine, "query_batch", fail)
+
+    async def oversized_header(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /health HTTP/1.1\r\nX-Big: " + b"a" * 100000 + b"\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return int(response.split()[1])
+
+    async def run():
+        server = RecommendationServer(engine, max_delay=0.001)
+        _, port = await server.start("127.0.0.1", 0)
+        try:
+            failed = await request(port, "POST", "/recommend", {"emojis": ["skull"]})
+            too_large = await oversized_header(port)
+            health = await request(port, "GET", "/health")
+        finally:
+            await server.stop()
+        return failed, too_large, health
+
+    failed, too_large, health = asyncio.run(run())
+    assert failed == (500, {"error": "internal server error"})
+    assert too_large == 431
+    # the server keeps serving after both
+    assert health[0] == 200
+
+
+def test_server_reloads_changed_artifacts(engine, monkeypatch):
+    monkeypatch.setattr(query_module, "VERSION_CHECK_INTERVAL", 0)
+
+    async def run():
+        server = RecommendationServer(engine, max_delay=0.001)
+        _, port = await server.start("127.0.0.1", 0)
+        try:
+            before = await request(port, "POST", "/recommend", {"emojis": ["skull"], "top_k": 3})
+            matrix = load_matrix(engine.matrix_path)
+            save_matrix(engine.matrix_path, matrix.matrix.toarray() * 2, matrix.keywords, matrix.books)
+            after = await request(port, "POST", "/recommend", {"emojis": ["skull"], "top_k": 3})
+        finally:
+            await server.stop()
+        return before, after, server.engine
+
+    before, after, reloaded = asyncio.run(run())
+    assert reloaded is not engine
+    assert after[1]["results"] != before[1]["results"]
+    assert [(r["title"], r["score"]) for r in after[1]["results"]] == reloaded.query(["skull"], top_k=3)
+
+
+def test_audited_requests_log_more_results_than_returned(engine, tmp_path):
+    log_path = tmp_path / "audit.jsonl"
+
+    async def run():
+        server = RecommendationServer(engine, max_delay=0.001)
+        _, port = await server.start("127.0.0.1", 0)
+        try:
+            with AuditLog(str(log_path)):
+                return await request(port, "POST", "/recommend", {"emojis": ["skull"], "top_k": 2})
+        finally:
+            await server.stop()
+
+    status, payload = asyncio.run(run())
+    assert status == 200
+    assert [(r["title"], r["score"]) for r in payload["results"]] == engine.query(["skull"], top_k=2)
+    (record,) = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert record["n_results"] == 2
+    assert [tuple(r) for r in record["results"]] == engine.query(["skull"], top_k=AUDIT_RESULTS)
+    assert len(record["results"]) > 2
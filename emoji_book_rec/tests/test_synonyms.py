@@ -0,0 +1,37 @@
+import json
+
+from emoji_book_rec.emoji_book_rec.utils import synonyms
+from emoji_book_rec.emoji_book_rec.utils.synonyms import expand_keywords, keyword_list_hash, load_synonyms
+
+
+def fake_wordnet(monkeypatch, calls):
+    def get_synonyms(word):
+        calls.append(word)
+        return {f"{word} synonym", word}
+
+    monkeypatch.setattr(synonyms, "get_synonyms", get_synonyms)
+
+
+def test_cache_is_built_once(tmp_path, monkeypatch):
+    calls = []
+    fake_wordnet(monkeypatch, calls)
+    path = tmp_path / "synonyms.json"
+
+    first = load_synonyms(["dark", "fun"], path)
+    assert first == {"dark": ["dark", "dark synonym"], "fun": ["fun", "fun synonym"]}
+    assert json.loads(path.read_text())["keywords_hash"] == keyword_list_hash(["fun", "dark"])
+
+    assert load_synonyms(["fun", "dark", "fun"], path) == first
+    assert calls == ["dark", "fun"]
+
+
+def test_only_new_keywords_are_looked_up(tmp_path, monkeypatch):
+    calls = []
+    fake_wordnet(monkeypatch, calls)
+    path = tmp_path / "synonyms.json"
+    path.write_text(json.dumps({"keywords_hash": "old", "synonyms": {"dark": ["darkness"], "gone": ["x"]}}))
+
+    expanded = expand_keywords(["wine", "dark"], path)
+    assert expanded == {"wine": {"wine", "wine synonym"}, "dark": {"dark", "darkness"}}
+    assert calls == ["wine"]
+    assert "gone" not in json.loads(path.read_text())["synonyms"]